@@ -35,35 +35,41 @@ Actors mainly consist of pygame.sprite  and pyode classes:
 '''
 
 import pygame
-import ode
 import math
+import numpy
 from random import random
-from time import gmtime
+from collections import OrderedDict
 import globals
 import world
+import animation
+from world import ode
 
-'''
- Initializing pygame sound system to play sounds in the game. To play multiple sounds,first load sound files from source and then  
- assign each sound to separate channels in range of mixer.get_num_channels()
- '''
-if globals.sound:
+def init_sound():
+    '''
+    Initializing pygame sound system to play sounds in the game. To play multiple sounds,first load sound files from source and then  
+    assign each sound to separate channels in range of mixer.get_num_channels()
+    Sound gets disabled if the mixer can't be initialized
+    '''
+    global num_of_channels, ambience_channel, goal_channel, kick_off_channel, \
+           bounce_channel, ambience_sound, goal_sound, kick_off_sound, \
+           bounce_sound
     try:
         pygame.mixer.init()
     except:
         globals.sound = 0
-
-if globals.sound:
+        return
+    
     num_of_channels = pygame.mixer.get_num_channels()
     ambience_channel= pygame.mixer.Channel(1)
     goal_channel = pygame.mixer.Channel(2)
     kick_off_channel = pygame.mixer.Channel(3)
     bounce_channel = pygame.mixer.Channel(4)
-
-# loading sounds
-ambience_sound = pygame.mixer.Sound('resources/sounds/ambience/ambience1.ogg')
-goal_sound = pygame.mixer.Sound('resources/sounds/goalll/goal.ogg')
-kick_off_sound = pygame.mixer.Sound('resources/sounds/kick-off/kickoff3.ogg')
-bounce_sound = pygame.mixer.Sound('resources/sounds/ball-kick/kick1.ogg')
+    
+    # loading sounds
+    ambience_sound = pygame.mixer.Sound('resources/sounds/ambience/ambience1.ogg')
+    goal_sound = pygame.mixer.Sound('resources/sounds/goalll/goal.ogg')
+    kick_off_sound = pygame.mixer.Sound('resources/sounds/kick-off/kickoff3.ogg')
+    bounce_sound = pygame.mixer.Sound('resources/sounds/ball-kick/kick1.ogg')
 
 class Actor(pygame.sprite.Sprite):
     '''An actor is something with representation on the game, can be ode world
@@ -82,25 +88,41 @@ class Actor(pygame.sprite.Sprite):
             self.controller.control(self, args)
 
 class Ball(Actor):
-    '''Represents the ball in the game. '''
+    '''Represents the ball in the game.
+    Balls are not thrown away when scoring, they are retired to a pool keeping
+    their ode body and geom disabled, and extra_ball takes them back from it.
+    There are never more than max_balls, so the simulation cost doesn't grow
+    with the goals scored'''
+    RADIOUS = 15 # of the game balls, in pixels
+    images = {} # radious -> ball image, shared by the balls with that size
+    pool = [] # retired balls, waiting to be used again
+    allocated = 0 # balls created since the last reset_pool
+    
     def __init__(self, pos=(0, 0), radious=10, density=800):
         '''@pos (x, y) is the pixel position in the screen
         @radious of the ball for collision detection, in pixels
         @density of the sphere, in kg/m^3'''
         Actor.__init__(self)
-        # set up the sprite
-        self.image = pygame.Surface((radious * 2, radious * 2),
-                                    pygame.SRCALPHA | pygame.HWSURFACE, 32).convert_alpha()
-        
-        self.rect = self.image.get_rect(center=pos)
+        # the rect is needed even without drawing, to test the goals
+        self.rect = pygame.Rect(0, 0, radious * 2, radious * 2)
+        self.rect.center = pos
         
-        image = pygame.image.load('resources/images/ball.png').convert_alpha()
-        image = pygame.transform.scale(image, self.rect.size)
-        self.image.blit(image, (0, 0))
+        # set up the sprite
+        if not globals.headless:
+            if not Ball.images.has_key(radious):
+                i = pygame.Surface((radious * 2, radious * 2),
+                                   pygame.SRCALPHA | pygame.HWSURFACE, 32).convert_alpha()
+                image = pygame.image.load('resources/images/ball.png').convert_alpha()
+                image = pygame.transform.scale(image, self.rect.size)
+                i.blit(image, (0, 0))
+                Ball.images[radious] = i
+            self.image = Ball.images[radious]
         
         # some internal values
         self.x, self.y = pos
         self.r = radious
+        self.slot = Ball.allocated # row on the globals.snapshot arrays
+        Ball.allocated += 1
         
         # dynamic properties set
         self.body = ode.Body(globals.ode_world)
@@ -111,9 +133,7 @@ class Ball(Actor):
         # object spatial setup
         self.geom = ode.GeomSphere(globals.ode_space, world.pix_to_dist(radious))
         self.geom.setBody(self.body)
-        # custom attributes
-        self.geom.mu = 0.0
-        self.geom.bounce = 0.5
+        world.set_material(self.geom, 'ball')
         
         # bind it to the 2d plane
         self.body.setPosition((0, 0, 0))
@@ -127,66 +147,158 @@ class Ball(Actor):
         self.join.setYParam(ode.paramVel, 0)
         self.join.setYParam(ode.paramFMax, globals.FIELD_FRICTION)
     
-    def update(self, delta):
-        '''Along the game, a constant force being applied to the ball in order to pull it over the middle of the field so that it wont get stuck somewhere 
-        in the game field. '''
-        x, y, z = self.body.getPosition()
-        self.rect.center = world.w_to_pix((x, y, z)) # update sprite position
-        
-        goal = self.rect.collidelist(globals.goals) # check if it's scoring and then play sound effects, draw animation if so.
-        if goal >= 0:
-            if globals.sound:
-                goal_channel.play(goal_sound)
-                goal_channel.fadeout(3000)
-            globals.assets.add(GoalAnimation())
-            globals.score[goal] += 1
-            self.kill()
+    @staticmethod
+    def update_all(balls):
+        '''Moves the sprites of the @balls to their positions, checks which
+        ones are scoring and kicks off again the ones stuck in the middle of
+        the field. The checks are done for every ball at once on the arrays
+        of globals.snapshot, so hundreds of balls don't cost hundreds of
+        update calls'''
+        balls = balls.sprites()
+        if not balls:
             return
-
-        
-        # position correction: the plane2d joint should keep z around 0 but
-        # it's inaccurate sometimes
-        self.body.setPosition((x, y, 0.0))
+        snapshot = globals.snapshot
+        slots = [b.slot for b in balls]
+        pix = snapshot.ball_pix[slots]
+        for b, center in zip(balls, pix):
+            b.rect.center = center # update sprite position
+        
+        # a ball is scoring when its rect touches a goal one
+        goal = numpy.empty(len(balls), int)
+        goal.fill(-1)
+        for i in xrange(len(globals.goals) - 1, -1, -1): # the first one wins
+            g = globals.goals[i]
+            inside = ((abs(pix[:, 0] - g.centerx) * 2 < g.w + Ball.RADIOUS * 2)
+                      & (abs(pix[:, 1] - g.centery) * 2 < g.h + Ball.RADIOUS * 2))
+            goal[inside] = i
+        
+        pos = snapshot.ball_pos[slots]
+        vel = snapshot.ball_vel[slots]
+        stuck = ((vel[:, 0] ** 2 + vel[:, 1] ** 2 < 0.0025)
+                 & (abs(pos[:, 0]) < 0.05) & (goal < 0))
+        
+        for i in numpy.flatnonzero(goal >= 0):
+            balls[i].score(int(goal[i]))
+        for i in numpy.flatnonzero(stuck):
+            balls[i].kickoff()
+    
+    def score(self, goal):
+        '''The ball got into the @goal: plays sound effects, draws the
+        animation and takes the ball out of the game'''
+        if globals.sound:
+            goal_channel.play(goal_sound)
+            goal_channel.fadeout(3000)
+        globals.assets.add(GoalAnimation())
+        globals.score[goal] += 1
+        globals.goal_log.append((world.ticks(), goal))
+        self.retire()
+    
+    @staticmethod
+    def apply_forces(balls):
+        '''Along the game, a constant force being applied to the @balls in order to pull them over the middle of the field so that they wont get stuck somewhere 
+        in the game field. Called before every simulation step, as ode clears
+        the forces after each one. The forces are computed for every ball at
+        once from the positions on globals.snapshot'''
+        balls = list(balls)
+        if not balls:
+            return
+        pos = globals.snapshot.ball_pos[[b.slot for b in balls]]
         
         # we will simulate the curvature of the field applying a force
         # proportional to the distance to the center of the field
-        force_factor = ((globals.DISPLAY_SIZE[0] / 2.0 - self.rect.centerx)
-                       / (globals.FIELD_SIZE[0] / 2.0))
-        self.body.addForce((force_factor * globals.FIELD_CONCAVE_FACTOR, 0, 0))
-        
-        vel = self.body.getLinearVel()[:2]
-        pos = self.body.getPosition()
-        if (vel[0]**2 + vel[1]**2) < 0.0025 and abs(pos[0]) < 0.05:
-            self.kickoff()
-        
-        #print 'vel ', str((vel[0]**2 + vel[1]**2))
-        #print 'pos ', str(pos[0])
+        forces = (-world.dist_to_pix(pos[:, 0]) / (globals.FIELD_SIZE[0] / 2.0)
+                  * globals.FIELD_CONCAVE_FACTOR)
+        for b, (x, y, z), f in zip(balls, pos, forces):
+            # position correction: the plane2d joint should keep z around 0
+            # but it's inaccurate sometimes
+            b.body.setPosition((x, y, 0.0))
+            b.body.addForce((f, 0, 0))
     
     def kickoff(self):
         ''' Inits ball position and kicking away with a random force in the middle; at the beginning of the game or after each scoring '''
         if globals.sound:
             kick_off_channel.play(kick_off_sound)
         self.body.setPosition((0, 0, 0))
-        self.body.addForce((random() * 100 - 50,
-                            random() * 1000 - 500,
-                            0))
+        # the kick force was tuned to be applied for 1/FPS seconds, the ball
+        # gets that impulse straight away so it doesn't depend on the step
+        k = 1.0 / (globals.FPS * self.mass.mass)
+        vx, vy, vz = self.body.getLinearVel()
+        self.body.setLinearVel((vx + (random() * 100 - 50) * k,
+                                vy + (random() * 1000 - 500) * k,
+                                0))
+        globals.snapshot.read_ball(self)
+    
+    def retire(self):
+        '''Takes the ball out of the game and into the pool. Its body and geom
+        are disabled, so ode neither integrates nor collides them'''
+        self.kill()
+        self.body.disable()
+        self.geom.disable()
+        globals.snapshot.forget_ball(self)
+        Ball.pool.append(self)
+    
+    def revive(self):
+        '''Brings a retired ball back, stopped in the middle of the field'''
+        self.body.enable()
+        self.geom.enable()
+        self.body.setPosition((0, 0, 0))
+        self.body.setLinearVel((0, 0, 0))
+        self.body.setAngularVel((0, 0, 0))
+    
+    def destroy(self):
+        '''Removes the ball from the ode world and space for good'''
+        self.kill()
+        self.join.attach(None, None)
+        self.body.disable()
+        world.forget_geom(self.geom)
+        # ode objects are destroyed once nothing references them
+        self.join = self.geom = self.body = None
     
     @staticmethod
     def extra_ball():
-        b = Ball(radious=15)
+        '''Puts another ball on the game, from the pool if possible
+        @returns the ball, None if there are max_balls on the game already'''
+        if Ball.pool:
+            b = Ball.pool.pop()
+            b.revive()
+        elif Ball.allocated < globals.config['game']['max_balls']:
+            b = Ball(radious=Ball.RADIOUS)
+        else:
+            return None
         globals.balls.add(b)
         b.kickoff()
+        return b
+    
+    @staticmethod
+    def reset_pool():
+        '''Destroys every ball, playing or retired, to start over'''
+        playing = []
+        if globals.balls is not None:
+            playing = globals.balls.sprites()
+        for b in Ball.pool + playing:
+            b.destroy()
+        Ball.pool = []
+        Ball.allocated = 0
 
 class PenguinBar(Actor):
     '''Represents a penguin bar in the game.
     It is: a number of penguins joined by a fixed joint to a hinged bar,
-    which is joined to a sliding bar. So with that, we will be able to simulate moving the bars forward-backward or kicking ball by turning them around hinge'''
+    which is joined to a sliding bar. So with that, we will be able to simulate moving the bars forward-backward or kicking ball by turning them around hinge
+    
+    With the 'kinematic' bars option of the config file, the bar is instead a
+    single body carrying every penguin geom, whose pose is set on each step
+    (see drive) with no joints for the solver to deal with'''
     
     PENGUIN_SIZE = 14 # in pixels
     BAR_HEIGHT = 0.18 # in world units
+    KINEMATIC_MASS = 1000.0 # so the balls can't move a kinematic bar
+    FOLLOW = 0.2 # part of the way to its target a kinematic bar moves on a
+                 # step of globals.PHYSICS_DT
+    HARD_TURN_SPEED = 3 * math.pi # radians per second
     bar_image = None # bar image
     sprites = None # Team penguin sprites
     sprites_k = None # Team penguin goal keepers sprites
+    frames = {} # (keeper, team) -> the frames cut from sprites or sprites_k
     num_frames = 0
     sprite_size = 0
     
@@ -207,32 +319,23 @@ class PenguinBar(Actor):
         if team == 0: self.color = (0, 64, 0) # TODO config?
         elif team == 1: self.color = (64, 0, 0)
         else: self.color = (128, 128, 128)
-            
-        # set up the sprite
-        self.base_image = pygame.Surface((64, globals.FIELD_SIZE[1]),
-                                    pygame.SRCALPHA
-                                    | pygame.HWSURFACE, 32).convert_alpha()
-        self.image = self.base_image.copy()
         
-        self.rect = self.image.get_rect(center=pos)
-        self.base_pos = self.rect.topleft
-        
-        if not PenguinBar.bar_image:
-            PenguinBar.bar_image = pygame.image.load(
-                'resources/images/barra.png').convert_alpha()
-        
-        if not PenguinBar.sprites:
-            PenguinBar.sprites = (pygame.image.load(
-                                    'resources/images/penguinR.png').convert_alpha(),
-                                  pygame.image.load(
-                                    'resources/images/penguinL.png').convert_alpha())
-            PenguinBar.sprites_k = (pygame.image.load(
-                                    'resources/images/keeperR.png').convert_alpha(),
-                                  pygame.image.load(
-                                    'resources/images/keeperL.png').convert_alpha())
-            r = PenguinBar.sprites[0].get_rect()
-            PenguinBar.sprite_size = r.h
-            PenguinBar.num_frames = r.w / r.h
+        # the column of the field the bar is on. The bar is painted on the
+        # background, only its penguins are sprites, on globals.penguins
+        self.rect = pygame.Rect(0, 0, 64, globals.FIELD_SIZE[1])
+        self.rect.center = pos
+        self.penguins = [] # its Penguin sprites
+        
+        # set up the sprites, nothing to draw when running headless
+        if not globals.headless:
+            PenguinBar.load_images()
+            self.bar_image_pos = (self.rect.x + (self.sprite_size -
+                                    PenguinBar.bar_image.get_rect().w) / 2.0,
+                                  self.rect.y)
+            frames = PenguinBar.frames[penguins == 1, team]
+            self.penguins = [Penguin(frames) for i in xrange(penguins)]
+            globals.penguins.add(self.penguins, layer=1)
+            self.cover = BarCover(self.bar_image_pos)
         
         # drawing optimization stuff
         self.updated = False
@@ -240,7 +343,32 @@ class PenguinBar(Actor):
         # get a position for the bar
         bar_pos = world.pix_to_w(pos)
         bar_pos = (bar_pos[0], bar_pos[1], self.BAR_HEIGHT) # height over z axis
+        self.bar_pos = bar_pos
         
+        self.rotating = 0
+        self.num_penguins = penguins
+        penguin_separation = globals.FIELD_SIZE[1] / penguins
+        first_penguin = globals.FIELD_TOP_LEFT[1] + penguin_separation / 2.0
+        penguins_pos = world.pix_to_w_array(
+                            [(pos[0], first_penguin + penguin_separation * i)
+                             for i in xrange(penguins)])
+        
+        self.kinematic = (globals.config['physics']['bars'] == 'kinematic'
+                          or world.ENGINE == 'flat') # flat has no joints
+        if self.kinematic:
+            self._init_kinematic(bar_pos, penguins_pos)
+        else:
+            self._init_joints(bar_pos, penguins_pos)
+        
+        h = world.pix_to_dist(globals.FIELD_SIZE[1])
+        if self.num_penguins == 1: # keeper can only move inside the goal area
+            self.max_extent = world.pix_to_dist(globals.GOAL_SIZE[1] * 1.5)
+        else:
+            self.max_extent = (h / float(self.num_penguins)) / 2
+    
+    def _init_joints(self, bar_pos, penguins_pos):
+        '''Builds the bar as a slider and a hinge with a body for each penguin
+        fixed to it'''
         # init the sliding part
         self.slider_bar = ode.Body(globals.ode_world)
         self.slider_bar.setPosition(bar_pos)
@@ -264,20 +392,14 @@ class PenguinBar(Actor):
         #self.hinge.setParam(ode.ParamVel, 0.0) # add a motor to simulate friction
         #self.hinge.setParam(ode.ParamFMax, 100.0)
         
-        self.rotating = 0
-        
         # penguins
-        self.num_penguins = penguins
-        self.bodies = [None] * penguins
-        penguin_separation = globals.FIELD_SIZE[1] / penguins
-        first_penguin = globals.FIELD_TOP_LEFT[1] + penguin_separation / 2.0
-        for i in xrange(penguins):
+        self.bodies = [None] * len(penguins_pos)
+        for i in xrange(len(penguins_pos)):
             # set up the ode body with a mass and position
             peng = ode.Body(globals.ode_world)
             self.bodies[i] = peng
             
-            pgpos = world.pix_to_w((pos[0], first_penguin + penguin_separation * i))
-            peng.setPosition(pgpos)
+            peng.setPosition(penguins_pos[i])
             
             # glue it to the hinged bar with a fixed joint
             peng.fixjoint = ode.FixedJoint(globals.ode_world)
@@ -292,89 +414,179 @@ class PenguinBar(Actor):
             peng.geom.setBody(self.bodies[i])
             
             # set custom friction and bounce for the penguins
-            peng.geom.mu = 0
-            peng.geom.bounce = -0.5 # will not bounce the ball, so we can stop it
+            world.set_material(peng.geom, 'penguin')
             
-        h = world.pix_to_dist(globals.FIELD_SIZE[1])
-        if self.num_penguins == 1: # keeper can only move inside the goal area
-            self.max_extent = world.pix_to_dist(globals.GOAL_SIZE[1] * 1.5)
+        # where everything was at the start, see reset
+        self.rest = [(b, b.getPosition(), b.getQuaternion())
+                     for b in [self.slider_bar, self.rot_bar] + self.bodies]
+    
+    def _init_kinematic(self, bar_pos, penguins_pos):
+        '''Builds the bar as a single body, the penguins are geoms placed
+        around it hanging from the bar'''
+        self.body = ode.Body(globals.ode_world)
+        mass = ode.Mass()
+        mass.setBoxTotal(self.KINEMATIC_MASS, 0.1,
+                         world.pix_to_dist(globals.FIELD_SIZE[1]), 0.1)
+        self.body.setMass(mass)
+        if hasattr(self.body, 'setKinematic'): # only on newer bindings
+            self.body.setKinematic()
+        
+        # offset of every penguin on the bar
+        self.offsets = [p[1] - bar_pos[1] for p in penguins_pos]
+        self.geoms = []
+        for dy in self.offsets:
+            geom = ode.GeomTransform(globals.ode_space)
+            geom.setGeom(ode.GeomSphere(None,
+                                        world.pix_to_dist(self.PENGUIN_SIZE)))
+            geom.getGeom().setPosition((0, dy, -self.BAR_HEIGHT))
+            geom.setBody(self.body)
+            world.set_material(geom, 'penguin')
+            self.geoms.append(geom)
+        
+        # current pose and the one set by rotate and slide
+        self.cur_angle = self.target_angle = 0.0
+        self.cur_extent = self.target_extent = 0.0
+        self.spin = 0
+        self._set_pose(0, 0, 1)
+    
+    def _set_pose(self, d_angle, d_extent, dt):
+        '''Kinematic mode: places the bar body on its current pose, with the
+        velocity it took to change it by @d_angle and @d_extent in @dt seconds'''
+        x, y, z = self.bar_pos
+        a = self.cur_angle
+        self.body.setPosition((x, y + self.cur_extent, z))
+        self.body.setQuaternion((math.cos(a / 2), 0, math.sin(a / 2), 0))
+        self.body.setLinearVel((0, d_extent / dt, 0))
+        self.body.setAngularVel((0, d_angle / dt, 0))
+    
+    def drive(self, dt):
+        '''Kinematic mode: moves the bar towards the targets of rotate and
+        slide, for a simulation step of @dt seconds. Like the joint stops of
+        the joints mode it gets a part of the way on each step. The velocity
+        is set too, so the contacts still push the balls.
+        Substeps (see tuzbolin.Match) are shorter than PHYSICS_DT, so both
+        the part of the way and the hard turn are scaled to the step length'''
+        steps = dt * globals.PHYSICS_RATE # in PHYSICS_DT steps
+        follow = 1 - (1 - self.FOLLOW) ** steps
+        if self.rotating:
+            d_angle = self.spin * self.HARD_TURN_SPEED * dt
+            self.rotating -= steps
+            if self.rotating <= 0: # back to the target the short way
+                self.rotating = 0
+                self.cur_angle = math.atan2(math.sin(self.cur_angle),
+                                            math.cos(self.cur_angle))
         else:
-            self.max_extent = (h / float(self.num_penguins)) / 2
+            d_angle = (self.target_angle - self.cur_angle) * follow
+        d_extent = (self.target_extent - self.cur_extent) * follow
+        self.cur_angle += d_angle
+        self.cur_extent += d_extent
+        self._set_pose(d_angle, d_extent, dt)
     
-    def clear(self, i):
-        ''' Clears the main image only to the actual visible area '''
-        i.fill((0, 0, 0, 0),
-            ((0, self.rect.y - self.base_pos[1]), self.rect.size))
-#        pygame.draw.line(i, (128, 128, 128), (50, 0),
-#                         (50, globals.FIELD_SIZE[1]), 5)
-        i.blit(PenguinBar.bar_image, ((self.rect.w / 2) - 11, 0))
-
-    def drawPenguins(self, i):
-        ''' Drawing body attributes of the penguins on the bars;
-        but before that we are doing a position converting from ode world to pygame world '''
-        size = self.sprite_size
-        x_offset = self.base_pos[0]
-        y_offset = self.base_pos[1]
-        ntl = None
-        nbr = None
-        for b in self.bodies:
-            bpos = b.getPosition()
-            dpos = world.w_to_pix(bpos)
-            
-            ## new boundaries
-            if not ntl:
-                h = max((y_offset, dpos[1] - self.sprite_size / 2.0))
-                ntl = (x_offset, h)
-            nbr = (x_offset + self.sprite_size, dpos[1] + self.sprite_size / 2.0)
-            
-            dpos = dpos[0] - x_offset, dpos[1] - y_offset            
-            a = -self.hinge.getAngle()
-            index = int(round((PenguinBar.num_frames/2) / math.pi * a))
-            if index < 0: index += PenguinBar.num_frames
-
-            pos = ((self.rect.w - size) / 2, dpos[1] - size / 2)            
-
-            if self.num_penguins == 1:
-                i.blit(PenguinBar.sprites_k[self.team], pos, (index * size, 0, size, size))
-            else:
-                i.blit(PenguinBar.sprites[self.team], pos, (index * size, 0, size, size))
+    def angle(self):
+        '''@returns the current angle of the bar, in radians, as the engine
+        has it. The game reads it from globals.snapshot'''
+        if self.kinematic:
+            return self.cur_angle
+        return self.hinge.getAngle()
+    
+    def penguin_positions(self):
+        '''@returns the world position of every penguin on the bar, as the
+        engine has it. The game reads them from globals.snapshot'''
+        if self.kinematic:
+            x, y, z = self.bar_pos
+            y += self.cur_extent
+            # the penguins hang from the bar, turning around the y axis
+            dx = -self.BAR_HEIGHT * math.sin(self.cur_angle)
+            dz = -self.BAR_HEIGHT * math.cos(self.cur_angle)
+            return [(x + dx, y + dy, z + dz) for dy in self.offsets]
+        return [b.getPosition() for b in self.bodies]
+    
+    @staticmethod
+    def load_images():
+        '''Loads the images shared by every bar, only the first time'''
+        if not PenguinBar.bar_image:
+            PenguinBar.bar_image = pygame.image.load(
+                'resources/images/barra.png').convert_alpha()
+        
+        if not PenguinBar.sprites:
+            PenguinBar.sprites = (pygame.image.load(
+                                    'resources/images/penguinR.png').convert_alpha(),
+                                  pygame.image.load(
+                                    'resources/images/penguinL.png').convert_alpha())
+            PenguinBar.sprites_k = (pygame.image.load(
+                                    'resources/images/keeperR.png').convert_alpha(),
+                                  pygame.image.load(
+                                    'resources/images/keeperL.png').convert_alpha())
+            r = PenguinBar.sprites[0].get_rect()
+            PenguinBar.sprite_size = r.h
+            PenguinBar.num_frames = r.w / r.h
             
-            # ==== DEBUG
-            if globals.debug:
-                dpos = world.w_to_pix((bpos[0], bpos[2], bpos[1]))
-                pos = (dpos[0] - self.rect.x, dpos[1] - size / 2)
-                pygame.draw.line(i, (0, 0, 0), (0, 46 + self.rect.h / 2),
-                                 (self.rect.w, 46 + self.rect.h / 2))
-                pygame.draw.circle(i, self.color, pos, self.PENGUIN_SIZE)
-            # ====
-        
-        self.rect = pygame.Rect(ntl, (size, nbr[1] - ntl[1]))
+            # every frame of the sheets cut once, so a penguin only has to
+            # pick one of them
+            size = PenguinBar.sprite_size
+            for keeper, sheets in ((0, PenguinBar.sprites),
+                                   (1, PenguinBar.sprites_k)):
+                for team, sheet in enumerate(sheets):
+                    PenguinBar.frames[keeper, team] = [
+                        sheet.subsurface((i * size, 0, size, size))
+                        for i in xrange(PenguinBar.num_frames)]
+    
+    def place_penguins(self):
+        '''Moves the penguin sprites to their positions, with the frame for the
+        angle of the bar'''
+        snapshot = globals.snapshot
+        a = -snapshot.angle(self)
+        index = int(round((PenguinBar.num_frames/2) / math.pi * a))
+        if index < 0: index += PenguinBar.num_frames
+        x = self.rect.centerx
+        for penguin, (px, y) in zip(self.penguins, snapshot.penguins_pix(self)):
+            penguin.place(index, (x, y))
+    
+    def cover_balls(self):
+        '''The balls go under the bar: when there are some crossing it, the
+        cover sprite draws the part of the bar over them'''
+        # only the balls in the lane of the bar can be that near
+        snapshot = globals.snapshot
+        pix = snapshot.ball_pix[snapshot.lane(self)]
+        bar_w = PenguinBar.bar_image.get_rect().w
+        cx = self.bar_image_pos[0] + bar_w / 2.0
+        ys = pix[abs(pix[:, 0] - cx) < Ball.RADIOUS + bar_w / 2.0, 1]
+        if len(ys):
+            self.cover.show(ys.min() - Ball.RADIOUS, ys.max() + Ball.RADIOUS)
+        else:
+            self.cover.kill()
 
     def update(self, delta):
-        ''' Handling bars behavior by drawing the bars and penguins over the
-        bars and then some debug stuff are being rendered over the game field '''
+        ''' Handling bars behavior, then placing the penguin sprites over the
+        bar, which is on the background'''
         Actor.update(self, delta)
-       
+        if globals.headless:
+            return
         if not self.updated:
             self.updated = True
-            i = self.base_image
-            self.clear(i)
-            self.drawPenguins(i)
-            
-            full = 0
-            for b in globals.balls:
-                if abs(b.rect.centerx - self.rect.centerx) < (self.rect.w / 2):
-                    full = 1
-            if full:
-                self.rect = self.base_image.get_rect(topleft=self.base_pos)
-                self.image = self.base_image.subsurface(((0, 0), self.rect.size))
-            else:
-                nr = pygame.Rect(self.rect)
-                nr.topleft = (0, self.rect.y - self.base_pos[1])
-                nr = nr.clip(self.base_image.get_rect())
-                #print self.base_image.get_rect(), " -- ", nr
-                
-                self.image = self.base_image.subsurface(nr)
+            self.place_penguins()
+        self.cover_balls()
+    
+    def reset(self):
+        '''Puts the bar back in its start position, still and centered'''
+        self.rotating = 0
+        if self.kinematic:
+            self.cur_angle = self.target_angle = 0.0
+            self.cur_extent = self.target_extent = 0.0
+            self._set_pose(0, 0, 1)
+            self.updated = False
+            return
+        
+        for body, pos, quaternion in self.rest:
+            body.setPosition(pos)
+            body.setQuaternion(quaternion)
+            body.setLinearVel((0, 0, 0))
+            body.setAngularVel((0, 0, 0))
+        # stop any hard turn
+        self.hinge.setParam(ode.ParamFMax, 0)
+        self.hinge.setParam(ode.ParamVel, 0)
+        self.rotate(0)
+        self.slide(0)
     
     def rotate(self, proportion):
         '''Sets the bar to rotate to the given angle (-1, 1)'''
@@ -388,8 +600,11 @@ class PenguinBar(Actor):
         
         t = math.pi * proportion / 2
         
-        self.hinge.setParam(ode.ParamHiStop, t)
-        self.hinge.setParam(ode.ParamLoStop, t)
+        if self.kinematic:
+            self.target_angle = t
+        else:
+            self.hinge.setParam(ode.ParamHiStop, t)
+            self.hinge.setParam(ode.ParamLoStop, t)
         self.updated = False
     
     def hard_turn(self, side):
@@ -400,6 +615,10 @@ class PenguinBar(Actor):
             side = 1
         
         self.rotating = 30
+        if self.kinematic: # see drive
+            self.spin = side
+            self.updated = False
+            return
         self.hinge.setParam(ode.ParamHiStop, ode.Infinity)
         self.hinge.setParam(ode.ParamLoStop, -ode.Infinity)
         self.hinge.setParam(ode.ParamFMax, 25.0 * self.num_penguins)
@@ -422,8 +641,11 @@ class PenguinBar(Actor):
         if self.team == 1:
             extent = -extent
         
-        self.slider.setParam(ode.ParamHiStop, extent + 0.01)
-        self.slider.setParam(ode.ParamLoStop, extent)
+        if self.kinematic:
+            self.target_extent = extent
+        else:
+            self.slider.setParam(ode.ParamHiStop, extent + 0.01)
+            self.slider.setParam(ode.ParamLoStop, extent)
         self.updated = False
 
 class ScoreBoard(Actor):
@@ -441,6 +663,7 @@ class ScoreBoard(Actor):
         #TODO : scoreboard rect should be placed according to field size parameters
         self.score = tuple(globals.score)
         self.position = position
+        self.changed = True # it's on globals.hud (see dirty.ChangedUpdates)
 
     def update(self, delta):
         '''At first, determine whether score has changed recently; if so, draws last score result '''
@@ -452,44 +675,106 @@ class ScoreBoard(Actor):
             self.rect = self.image.get_rect(midbottom = (globals.DISPLAY_SIZE[0]/2,
                                                          globals.FIELD_TOP_LEFT[1]))
             self.score = sc
+            self.changed = True
+
+class Penguin(Actor):
+    '''A penguin of a bar on the screen. Its image is one of the frames of
+    its bar sheet, cut once (see PenguinBar.load_images), so placing it
+    doesn't draw anything, it's only blitted with the rest of the sprites'''
+    def __init__(self, frames):
+        '''@frames are the images for every angle of the bar'''
+        Actor.__init__(self)
+        self.frames = frames
+        self.image = frames[0]
+        self.rect = self.image.get_rect()
+    
+    def place(self, index, center):
+        '''Shows the frame @index at @center'''
+        self.image = self.frames[index]
+        self.rect.center = center
+
+class BarCover(Actor):
+    '''The part of a bar over the balls crossing it, as the bar is painted on
+    the background and the balls would be drawn over it'''
+    def __init__(self, pos):
+        '''@pos is where the bar image is on the screen'''
+        Actor.__init__(self)
+        self.pos = pos
+        self.bar_rect = PenguinBar.bar_image.get_rect(topleft=pos)
+        self.image = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+    
+    def show(self, top, bottom):
+        '''Covers the bar rows between @top and @bottom'''
+        r = pygame.Rect(self.bar_rect.x, top, self.bar_rect.w, bottom - top)
+        r = r.clip(self.bar_rect)
+        if not r.h:
+            self.kill()
+            return
+        self.rect = r
+        self.image = PenguinBar.bar_image.subsurface(
+                                        r.move(-self.pos[0], -self.pos[1]))
+        if not self.alive():
+            globals.penguins.add(self, layer=0)
 
 class Timer(Actor):
-    '''Shows a timer accounting the remaining game time'''
+    '''Shows a timer accounting the remaining game time, as mm:ss:t (t are
+    tenths of second). Its characters are taken from a strip rendered once,
+    each one on a cell of its own, and only the cells whose character changed
+    are blitted again. It's on globals.hud (see dirty.ChangedUpdates), so it
+    isn't drawn on the frames the text doesn't change'''
     def __init__(self, position=(0, 0)):
         Actor.__init__(self)
         self.position = position
-        self.rect = pygame.Rect(self.position, (0, 0))
-        self.ttl = 0
-        self.image = pygame.Surface((globals.font.length("77:77:77"),
-                                     globals.font.line_heigth)).convert_alpha()
+        self.text = None # the text shown, None while hidden
+        self.drawn = ' ' * 7 # the text on shown_img
+        self.changed = True
+        
+        # the strip: every digit on cells of the same width, and the colon
+        font = globals.font
+        self.glyphs = dict([(c, font.compose(c)) for c in '0123456789:'])
+        cell = max([self.glyphs[c].get_rect().w for c in '0123456789'])
+        colon = self.glyphs[':'].get_rect().w
+        self.cells = []
+        x = 0
+        for c in '00:00:0':
+            w = (c == ':') and colon or cell
+            self.cells.append(pygame.Rect(x, 0, w, font.line_heigth))
+            x += w
+        self.shown_img = pygame.Surface((x, font.line_heigth),
+                                        pygame.SRCALPHA, 32).convert_alpha()
+        self.shown_img.fill((0, 0, 0, 0))
         self.hidden_img = pygame.Surface((0, 0))
-        self.hidden_rect = pygame.Rect(0, 0, 0, 0)
-        self.hiding = 0
+        self.image = self.hidden_img
+        self.rect = pygame.Rect(self.position, (0, 0))
 
     def update(self, delta):
         Actor.update(self, delta)
-        remains = globals.time_limit - pygame.time.get_ticks()
-        updating = 0
+        remains = max((0, globals.time_limit - world.ticks()))
+        text = None
+        # shown for 5 seconds every minute, and all along the last one
         if ((remains%60000 > 55000) or (remains < 60000)):
-            updating = 1
-            if self.hiding:
-                self.image, self.hidden_img = self.hidden_img, self.image
-                self.rect, self.hidden_rect = self.hidden_rect, self.rect
-                self.hiding = 0
-        else:
-            if not self.hiding:
-                self.image, self.hidden_img = self.hidden_img, self.image
-                self.rect, self.hidden_rect = self.hidden_rect, self.rect
-                self.hiding = 1
-        
-        if updating:
-            self.image.fill((0, 0, 0, 0))
-            st = gmtime(remains / 1000.0)
-            tiempo = "%(m)02d:%(s)02d:%(c)02d" % {'m': st[4],
-                                                  "s": st[5],
-                                                  "c": remains%999}
-            tiempo = tiempo[:-1]
-            globals.font.render(self.image, str(tiempo), (0, 0))
+            text = "%02d:%02d:%d" % (remains / 60000 % 60,
+                                     remains / 1000 % 60, remains / 100 % 10)
+        if text == self.text:
+            return
+        
+        self.text = text
+        self.changed = True
+        if text is None:
+            self.image = self.hidden_img
+            self.rect = pygame.Rect(self.position, (0, 0))
+            return
+        
+        self.image = self.shown_img
+        self.rect = self.image.get_rect(topleft=self.position)
+        for c, old, cell in zip(text, self.drawn, self.cells):
+            if c != old:
+                g = self.glyphs[c]
+                self.image.fill((0, 0, 0, 0), cell)
+                self.image.blit(g, g.get_rect(midtop=cell.midtop), None,
+                                pygame.BLEND_RGBA_MAX)
+        self.drawn = text
 
 class GoalAnimation(Actor):
     '''Animates a text image that grows from the center of the screen when a
@@ -499,32 +784,57 @@ class GoalAnimation(Actor):
     @ttl is the time that the animation will last
     @repeats is the number of times the image will reapear'''
     image = pygame.image.load('resources/images/goal.png')
+    clips = {} # steps -> the growth clip, scaled once (see load_images)
+    SHRINK_TIME = 300 # the growth is played backwards on the last milliseconds
     
     def __init__(self, steps=10, ttl=3000):
         Actor.__init__(self)
-        self.image = GoalAnimation.image
-        self.rect = self.image.get_rect(center=(globals.DISPLAY_SIZE[0] / 2.0,
-                                                globals.DISPLAY_SIZE[1] / 2.0))
         steps = max((1, steps))
         ttl = max((500, ttl))
         
-        self.advance = 1.0 / steps
-        self.scale = 0.0
-        self.ttl = pygame.time.get_ticks() + ttl
+        self.clip = None
+        self.index = None
+        self.image = GoalAnimation.image
+        if not globals.headless:
+            self.clip = GoalAnimation.load_images(steps)
+            self.image = self.clip.frames[0]
+        self.rect = self.image.get_rect(center=(globals.DISPLAY_SIZE[0] / 2.0,
+                                                globals.DISPLAY_SIZE[1] / 2.0))
+        # the extra ball is part of the game, so it's timed with the simulation
+        self.start = world.ticks()
+        self.ttl = self.start + ttl
+        # nobody minds a late frame while celebrating
+        if globals.gc_scheduler:
+            globals.gc_scheduler.request_full()
+    
+    @staticmethod
+    def load_images(steps=10):
+        '''Scales the frames of the growth in @steps, only the first time
+        @returns its clip, a step on each frame drawn'''
+        clip = GoalAnimation.clips.get(steps)
+        if not clip:
+            image = GoalAnimation.image.convert_alpha()
+            clip = animation.AnimationClip(animation.scaled_frames(image, steps),
+                                           1000.0 / globals.FPS)
+            GoalAnimation.clips[steps] = clip
+        return clip
 
     def update(self, delta):
         Actor.update(self, delta)
-        if self.scale <= 1:
-            self.image = pygame.transform.rotozoom(GoalAnimation.image, 0, self.scale)
-            self.rect = self.image.get_rect(center=(globals.DISPLAY_SIZE[0] / 2.0,
-                                                globals.DISPLAY_SIZE[1] / 2.0))
-            self.scale += self.advance
-        
-        if pygame.time.get_ticks() > self.ttl - 300:
-            self.scale *= 0.5
-        
-        
-        if pygame.time.get_ticks() > self.ttl:
+        now = world.ticks()
+        if self.clip:
+            elapsed = now - self.start
+            left = self.ttl - now
+            if left < self.SHRINK_TIME:
+                elapsed = left * self.clip.duration / self.SHRINK_TIME
+            index = self.clip.index(elapsed)
+            if index != self.index:
+                self.index = index
+                self.image = self.clip.frames[index]
+                self.rect = self.image.get_rect(center=(globals.DISPLAY_SIZE[0] / 2.0,
+                                                        globals.DISPLAY_SIZE[1] / 2.0))
+        
+        if now > self.ttl:
             Ball.extra_ball()
             self.kill()
 
@@ -537,45 +847,34 @@ class Public(Actor):
     @per_loops cycles per loops'''
     def __init__(self, image, position, rate=1, delay=3000, per_loops=1):
         Actor.__init__(self)
-        self.__image = pygame.image.load(image)
         self.position = position
-        r = self.__image.get_rect()
-        self.size = r.h # w and h of each image
+        # each frame was shown on rate + 1 drawn frames
+        self.clip = animation.AnimationClip(
+                        animation.SpriteSheet.load(image).frames,
+                        (rate + 1) * 1000.0 / globals.FPS,
+                        per_loops, delay, repeat=True)
+        self.start = pygame.time.get_ticks()
         self.index = 0 # current index of the sprite
-        self.rate = rate # ticks to wait to update the state
-        self.wait_frame = rate # current wait until the next update
-        self.num_frames = r.w / r.h # number of frames of the sprite
-        self.loop_delay = delay # delay between sprite loops
-        self.loop_wait = 0 # current delay
-        self.cycles_per_loop = per_loops - 1 # each animation cycle will be these sprite cycles
-        self.cycle_wait = self.cycles_per_loop # current animation cycle
         
         # Sprite class attributes
-        self.image = self.__image.subsurface((0, 0, self.size, self.size))
+        self.image = self.clip.frames[0]
         self.rect = self.image.get_rect(center = self.position)
 
     def update(self, delta):
         Actor.update(self, delta)
-        if pygame.time.get_ticks() > self.loop_wait: # wait for the next animation loop
-            if not self.wait_frame: # delay the animation if needed
-                self.image = self.__image.subsurface((self.index * self.size, 0,
-                                                      self.size, self.size))
-                self.rect = self.image.get_rect(center = self.position)
-                self.index = self.index + 1
-                if self.index >= self.num_frames:
-                    if not self.cycle_wait: # if we ended the animation loop, wait
-                        self.loop_wait = pygame.time.get_ticks() + self.loop_delay
-                        self.cycle_wait = self.cycles_per_loop
-                    else:
-                        self.cycle_wait -= 1
-                    self.index = 0
-                self.wait_frame = self.rate
-            else:
-                self.wait_frame -= 1
+        index = self.clip.index(pygame.time.get_ticks() - self.start)
+        if index != self.index:
+            self.index = index
+            self.image = self.clip.frames[index]
 
 class Font:
     '''Works in a similar way to pygame.Font, but it blits surfaces to other
-    surfaces directly instead of generating a new surface'''
+    surfaces directly instead of generating a new surface.
+    The texts rendered again and again (the messages of the waiting and end
+    screens...) are composed once in a surface of their own, kept in a least
+    recently used cache of @cache_size texts, 0 to disable it. The texts of
+    several lines are cached line by line. A line is only composed the second
+    time it's rendered, so one-off texts are still blitted glyph by glyph'''
     _charmap = None
     def __init__(self,
                  chars=' !"#$%&\'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNO'
@@ -585,8 +884,15 @@ class Font:
                  color=(255, 255, 255),
                  bg_color=(0, 0, 0, 0),
                  bold = False,
-                 italic = False):
+                 italic = False,
+                 cache_size=64):
         self._charmap = {}
+        self.cache_size = cache_size
+        self._surfaces = OrderedDict() # (text, zoom) -> composed surface
+        self._seen = OrderedDict() # (text, zoom) rendered once, not composed
+        self._lengths = OrderedDict() # (text, zoom) -> length
+        self.hits = 0
+        self.misses = 0
         pygame.font.init()
         pgf = pygame.font.Font(font, size)
         pgf.set_bold(bold)
@@ -607,28 +913,100 @@ class Font:
         @pos (x, y) - is the top left corner of the first character
         @zoom float - is the relative size to apply to the font, zooming is
                       discouraged since it doesn't performs any antialias and
-                      it's quite slow'''
+                      it's quite slow
+        @returns the rects of the lines drawn'''
+        rects = []
+        x, y = pos
+        for line in str(text).split('\n'):
+            rects.append(self.render_line(surface, line, (x, y), zoom))
+            # the next lines start on the left of the surface, not of pos
+            x, y = 0, y + self.line_heigth
+        return rects
+
+    def render_line(self, surface, line, pos, zoom=1):
+        '''Renders a @line of text, with no new lines, from the cache if
+        possible (see Font)
+        @returns its rect'''
+        key = (line, zoom)
+        image = self._surfaces.get(key)
+        if image is not None:
+            self.hits += 1
+            del self._surfaces[key] # the most recently used go last
+            self._surfaces[key] = image
+            surface.blit(image, pos)
+            return pygame.Rect(pos[0], pos[1], image.get_rect().w,
+                               self.line_heigth)
+        
+        self.misses += 1
+        if self.cache_size and line:
+            if key in self._seen:
+                del self._seen[key]
+                image = self.compose(line, zoom)
+                self._surfaces[key] = image
+                if len(self._surfaces) > self.cache_size:
+                    self._surfaces.popitem(last=False)
+                surface.blit(image, pos)
+                return pygame.Rect(pos[0], pos[1], image.get_rect().w,
+                                   self.line_heigth)
+            self._seen[key] = True
+            if len(self._seen) > self.cache_size:
+                self._seen.popitem(last=False)
+        
         f = self._charmap
         p = list(pos)
-        for c in str(text):
-            rot = 0
+        for c in line:
             if not f.has_key(c):
-                if c == '\n':
-                    p[1] += self.line_heigth
-                    p[0] = 0
-                    continue
-                else:
-                    c = '?'
+                c = '?'
             if zoom == 1:
                 surface.blit(f[c], p)
             else:
-                surface.blit(pygame.transform.rotozoom(f[c], rot, zoom), p)
+                surface.blit(pygame.transform.rotozoom(f[c], 0, zoom), p)
             p[0] += f[c].get_rect().w * zoom
         
-        p[1] += self.line_heigth
-        return [pygame.Rect(pos[0], pos[1], p[0] - pos[0], p[1] - pos[1])]
+        return pygame.Rect(pos[0], pos[1], p[0] - pos[0], self.line_heigth)
+
+    def clear_cache(self):
+        '''Forgets the composed texts and lengths, and the counters'''
+        self._surfaces.clear()
+        self._seen.clear()
+        self._lengths.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def compose(self, text, zoom=1):
+        '''@returns a new surface with the @text of a single line, as render
+        would draw it'''
+        f = self._charmap
+        chars = [f.get(c, f['?']) for c in text]
+        if zoom == 1:
+            glyphs = chars
+        else:
+            glyphs = [pygame.transform.rotozoom(c, 0, zoom) for c in chars]
+        w = sum([c.get_rect().w for c in chars]) * zoom
+        h = max([self.line_heigth] + [g.get_rect().h for g in glyphs])
+        image = pygame.Surface((int(math.ceil(w)) or 1, h), pygame.SRCALPHA, 32)
+        image = image.convert_alpha()
+        x = 0
+        for c, g in zip(chars, glyphs):
+            # the glyphs are copied, not blended over the transparent surface
+            image.blit(g, (x, 0), None, pygame.BLEND_RGBA_MAX)
+            x += c.get_rect().w * zoom
+        return image
 
     def length(self, text, zoom=1):
+        '''@returns the width of the widest line of the @text, in pixels'''
+        key = (text, zoom)
+        w = self._lengths.pop(key, None)
+        if w is None:
+            w = self.measure(text, zoom)
+        if self.cache_size:
+            self._lengths[key] = w
+            if len(self._lengths) > self.cache_size:
+                self._lengths.popitem(last=False)
+        return w
+
+    def measure(self, text, zoom=1):
+        '''length, without the cache'''
         f = self._charmap
         w = 0
         mw = w
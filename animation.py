@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Frame animations. The frames of an animation are made once, when its
+images are loaded, cut from a strip (see SpriteSheet) or scaled from an
+image (see scaled_frames), and an AnimationClip only has to pick the one
+shown at a given time. Nothing is transformed or cut while drawing.'''
+
+import pygame
+
+class SpriteSheet:
+    '''The frames of a strip of square images, side by side, as subsurfaces
+    of the strip. Use load, so every sheet is loaded and cut only once'''
+    _sheets = {} # path -> SpriteSheet
+    
+    def __init__(self, image):
+        '''@image is the strip surface, its height is the size of a frame'''
+        self.image = image
+        self.size = image.get_rect().h
+        self.frames = [image.subsurface((i * self.size, 0, self.size, self.size))
+                       for i in xrange(image.get_rect().w / self.size)]
+    
+    @staticmethod
+    def load(path):
+        '''@returns the sheet of the image file @path'''
+        sheet = SpriteSheet._sheets.get(path)
+        if not sheet:
+            sheet = SpriteSheet(pygame.image.load(path).convert_alpha())
+            SpriteSheet._sheets[path] = sheet
+        return sheet
+
+def scaled_frames(image, steps):
+    '''@returns @steps frames of @image growing from 1/@steps of its size to
+    its full size'''
+    frames = [pygame.transform.rotozoom(image, 0, float(i) / steps)
+              for i in xrange(1, steps)]
+    frames.append(image)
+    return frames
+
+class AnimationClip:
+    '''Plays a list of frames on a time base: it's asked for the frame
+    shown some milliseconds after the clip started, so it runs at the same
+    speed whatever the frame rate is
+    
+    @frames are the images, in order
+    @frame_time is the milliseconds each frame is shown
+    @loops is the times the frames are played in a row
+    @delay is the milliseconds the last frame is held after the loops
+    @repeat plays it again after the delay, else it stays on the last frame'''
+    def __init__(self, frames, frame_time, loops=1, delay=0, repeat=False):
+        self.frames = frames
+        self.frame_time = max((1.0, frame_time))
+        self.loops = max((1, loops))
+        self.delay = delay
+        self.repeat = repeat
+        # milliseconds playing the frames, without the delay
+        self.duration = len(frames) * self.frame_time * self.loops
+    
+    def index(self, elapsed):
+        '''@returns the index of the frame shown @elapsed milliseconds after
+        the clip started'''
+        if self.repeat:
+            elapsed %= self.duration + self.delay
+        if elapsed >= self.duration:
+            return len(self.frames) - 1
+        return int(max((0, elapsed)) / self.frame_time) % len(self.frames)
+    
+    def frame(self, elapsed):
+        '''@returns the frame shown @elapsed milliseconds after the clip
+        started'''
+        return self.frames[self.index(elapsed)]
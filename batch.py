@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Plays many headless matches in parallel and aggregates their results.
+As the game state lives in module globals there can be just one world per
+process, so the matches are spread over a pool of processes using all the
+cores. Each process builds its table once and resets it between matches.
+
+Usage: python batch.py -n 1000 [-j processes] [--seed 0] [--controller ai]
+                       [--output results.jsonl]'''
+
+import sys
+import time
+import json
+import random
+import multiprocessing
+from optparse import OptionParser
+
+import globals
+import world
+import control
+import tuzbolin
+
+CONTROLLERS = {'ai': control.AIController,
+               'scripted': control.ScriptedController}
+
+_match = None # the table of this worker process
+
+def init_worker(controller):
+    '''Builds the table of a worker process, once
+    @controller name of the controller playing every bar'''
+    global _match
+    random.seed(0) # same scripted controllers on every worker
+    globals.headless = 1
+    globals.sound = 0
+    world.init_ode()
+    tuzbolin.startup(CONTROLLERS[controller])
+    _match = tuzbolin.Match()
+
+def run_match(args):
+    '''Plays a single headless match on the worker table, after a reset
+    @args (number, seed) of the match
+    @returns the tuzbolin.headless_match results plus the match number and
+    seed'''
+    number, seed = args
+    random.seed(seed)
+    result = tuzbolin.headless_match(_match)
+    result['match'] = number
+    result['seed'] = seed
+    return result
+
+class Report:
+    '''Aggregates the results of the matches as they arrive'''
+    def __init__(self):
+        self.matches = 0
+        self.wins = [0, 0] # by team, indexed as globals.score
+        self.draws = 0
+        self.goals = 0
+        self.duration = 0.0
+        self.real_time = 0.0
+        self.goal_times = [] # milliseconds from the start of the match
+
+    def add(self, result):
+        score = result['score']
+        self.matches += 1
+        if score[0] > score[1]:
+            self.wins[0] += 1
+        elif score[1] > score[0]:
+            self.wins[1] += 1
+        else:
+            self.draws += 1
+        self.goals += sum(score)
+        self.duration += result['duration']
+        self.real_time += result['real_time']
+        self.goal_times += [t for t, goal in result['goals']]
+
+    def summary(self, wall_time):
+        '''@wall_time the seconds the whole batch took
+        @returns the report as a printable string'''
+        n = self.matches or 1
+        lines = ['matches:        %d' % self.matches,
+                 'wins:           %d - %d (%d draws)' % (self.wins[1],
+                                                         self.wins[0],
+                                                         self.draws),
+                 'goals/match:    %.2f' % (self.goals / float(n)),
+                 'match duration: %.1fs simulated, %.2fs real' % (
+                                    self.duration / n, self.real_time / n)]
+        if self.goal_times:
+            self.goal_times.sort()
+            lines.append('goal time:      %.1fs median' %
+                         (self.goal_times[len(self.goal_times) / 2] / 1000.0))
+        if wall_time:
+            lines.append('throughput:     %.0f matches/hour' %
+                         (self.matches * 3600.0 / wall_time))
+        return '\n'.join(lines)
+
+def run(matches, processes=None, seed=0, controller='ai', output=None):
+    '''Plays the matches on a process pool, results are streamed back and
+    aggregated as each match ends
+    @matches number of matches to play
+    @processes size of the pool, defaults to the number of cpus
+    @seed of the first match, each match uses the next one
+    @controller name of the controller playing every bar, see CONTROLLERS
+    @output optional file to write each result to, as a json line
+    @returns the Report'''
+    report = Report()
+    pool = multiprocessing.Pool(processes, init_worker, (controller,))
+    tasks = [(i, seed + i) for i in xrange(matches)]
+    try:
+        for result in pool.imap_unordered(run_match, tasks):
+            report.add(result)
+            if output:
+                output.write(json.dumps(result) + '\n')
+                output.flush()
+            sys.stderr.write('\r%d/%d' % (report.matches, matches))
+        sys.stderr.write('\n')
+    finally:
+        pool.terminate()
+    return report
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-n', '--matches', type='int', default=100,
+                      help='number of matches to play')
+    parser.add_option('-j', '--processes', type='int', default=None,
+                      help='worker processes, defaults to the number of cpus')
+    parser.add_option('--seed', type='int', default=0,
+                      help='random seed of the first match')
+    parser.add_option('--controller', choices=CONTROLLERS.keys(),
+                      default='ai', help='ai or scripted')
+    parser.add_option('--output', default=None,
+                      help='file to write every match result to (json lines)')
+    options, args = parser.parse_args()
+    
+    output = None
+    if options.output:
+        output = open(options.output, 'w')
+    start = time.time()
+    report = run(options.matches, options.processes, options.seed,
+                 options.controller, output)
+    if output:
+        output.close()
+    print report.summary(time.time() - start)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Penguin bars benchmark: simulation cost of the joints bars, slider,
+hinge and fixed joints solved on every step, against the kinematic bars,
+a single body per bar with no joints. See the 'bars' option on the config
+file.
+
+Usage: python benchmarks/bars.py [steps]'''
+
+import sys
+
+import common
+import globals
+
+MODES = ['joints', 'kinematic']
+BALLS = [1, 10, 100]
+
+def bench_bars(mode, balls, steps):
+    '''@returns the mean time, in seconds, of world.step alone and of a whole
+    simulation step on a table with the given bars mode and number of balls'''
+    conf = globals.config['physics']
+    old_mode, conf['bars'] = conf['bars'], mode
+    common.headless_table(max_balls=balls)
+    conf['bars'] = old_mode
+    common.add_balls(balls - len(globals.balls))
+    match = common.tuzbolin.Match()
+    dt = match.stepper.dt
+    sim_step = match.sim_step
+    
+    # moving bars, the joints have work to do
+    for bar in globals.bars:
+        bar.rotate(0.5)
+        bar.slide(0.5)
+    for i in xrange(10):
+        sim_step(dt)
+    
+    w_step = globals.ode_world.step
+    step = common.timeit(lambda: w_step(dt), steps)
+    whole = common.timeit(lambda: sim_step(dt), steps)
+    return step, whole
+
+def results(steps=200):
+    '''@returns (name, seconds) for every bars mode and number of balls, for
+    the suite (see run.py)'''
+    r = []
+    for balls in BALLS:
+        for mode in MODES:
+            step, whole = bench_bars(mode, balls, steps)
+            r.append(('bars.%s.%d.world_step' % (mode, balls), step))
+            r.append(('bars.%s.%d.sim_step' % (mode, balls), whole))
+    return r
+
+if __name__ == '__main__':
+    steps = 200
+    if len(sys.argv) > 1:
+        steps = int(sys.argv[1])
+    rows = []
+    for balls in BALLS:
+        for mode in MODES:
+            step, whole = bench_bars(mode, balls, steps)
+            rows.append([balls, mode, '%.1f' % (step * 1e6),
+                         '%.1f' % (whole * 1e6)])
+    print common.table(['balls', 'bars', 'us/world.step', 'us/sim_step'],
+                       rows)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Broadphase benchmark: cost of space.collide on every kind of collision
+space with 1, 10, 100 and 500 balls on the table, against its 22 penguins.
+Use it to choose the 'space' option on the config file.
+
+Usage: python benchmarks/collide.py [steps]'''
+
+import sys
+
+import common
+import globals
+import world
+from world import ode
+
+SPACES = ['simple', 'hash', 'quadtree']
+BALLS = [1, 10, 100, 500]
+
+def bench_collide(space, balls, steps):
+    '''@returns the mean time of a space.collide call, in seconds, on a table
+    with the given kind of space and number of balls'''
+    common.headless_table(space, max_balls=balls)
+    common.add_balls(balls - len(globals.balls))
+    match = common.tuzbolin.Match()
+    # let the balls spread and settle
+    for i in xrange(10):
+        match.sim_step(match.stepper.dt)
+    
+    # world.collide, as the step does: the contacts of every call start from
+    # none, so the max_step_contacts cap doesn't cut the later ones short
+    cgroup = ode.JointGroup()
+    collide = world.collide
+    def run():
+        collide(cgroup)
+    world.stats['pairs'] = 0
+    t = common.timeit(run, steps)
+    return t, world.stats['pairs'] / steps
+
+def results(steps=200):
+    '''@returns (name, seconds) for every space and number of balls, for
+    the suite (see run.py)'''
+    return [('collide.%s.%d' % (space, balls), bench_collide(space, balls, steps)[0])
+            for balls in BALLS for space in SPACES]
+
+if __name__ == '__main__':
+    steps = 200
+    if len(sys.argv) > 1:
+        steps = int(sys.argv[1])
+    rows = []
+    for balls in BALLS:
+        for space in SPACES:
+            t, pairs = bench_collide(space, balls, steps)
+            rows.append([balls, space, '%.1f' % (t * 1e6), pairs])
+    print common.table(['balls', 'space', 'us/collide', 'pairs'], rows)
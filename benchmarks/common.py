@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Helpers shared by the benchmarks. They have to be run from the root of
+the project, as the game loads its config and resources from there:
+    python benchmarks/collide.py
+The display and the sound are SDL dummy drivers, so they run on machines
+with neither, and there are no wiimotes: the computer plays every bar.'''
+
+import os
+import sys
+import time
+from random import random, seed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+import globals
+import world
+import actors
+import tuzbolin
+
+def startup(max_balls=None, **kwargs):
+    '''tuzbolin.startup with room for @max_balls, if given. The config is
+    left as it was, so a benchmark doesn't change the table of the next ones
+    @kwargs are the startup arguments'''
+    game = globals.config['game']
+    config_max = game['max_balls']
+    if max_balls:
+        game['max_balls'] = max_balls
+    try:
+        tuzbolin.startup(**kwargs)
+    finally:
+        game['max_balls'] = config_max
+
+def headless_table(space=None, rand_seed=0, max_balls=None):
+    '''Sets up a headless table, bars and a single ball, with a new world
+    @space kind of collision space, see world.new_space
+    @rand_seed to get the same table every time
+    @max_balls room for the balls of add_balls, the config one by default'''
+    seed(rand_seed)
+    globals.headless = 1
+    globals.sound = 0
+    globals.sim_time = 0.0
+    world.init_ode(space)
+    startup(max_balls)
+
+def init_display():
+    '''Opens the dummy display and loads the background and fonts the game
+    draws with, only the first time'''
+    if getattr(tuzbolin, 'display', None):
+        return
+    pygame.init()
+    tuzbolin.display = pygame.display.set_mode(globals.DISPLAY_SIZE)
+    tuzbolin.field_bg = pygame.image.load('resources/images/fondo.jpg')
+    globals.font = actors.Font(font='resources/Domestic_Manners.ttf', size=52,
+                               color=(255, 175, 0), bg_color=None, bold=1)
+    globals.debug_font = actors.Font()
+
+def display_table(rand_seed=0, max_balls=None):
+    '''Sets up a table that draws, on the dummy display, with a new world
+    @rand_seed to get the same table every time
+    @max_balls room for the balls of add_balls, the config one by default'''
+    seed(rand_seed)
+    globals.headless = 0
+    globals.sound = 0
+    globals.sim_time = 0.0
+    init_display()
+    world.init_ode()
+    startup(max_balls, ai_players=1)
+
+def add_balls(n):
+    '''Adds balls at random positions of the field, without kicking them
+    @n number of balls to add'''
+    w = globals.FIELD_SIZE[0] - 60
+    h = globals.FIELD_SIZE[1] - 60
+    for i in xrange(n):
+        b = actors.Ball(radious=actors.Ball.RADIOUS)
+        globals.balls.add(b)
+        b.body.setPosition(world.pix_to_w(
+                        (globals.FIELD_TOP_LEFT[0] + 30 + random() * w,
+                         globals.FIELD_TOP_LEFT[1] + 30 + random() * h)))
+        b.body.setLinearVel((random() * 2 - 1, random() * 2 - 1, 0))
+        globals.snapshot.read_ball(b)
+
+def timeit(function, repeat):
+    '''Runs @function @repeat times
+    @returns the mean time of a call, in seconds'''
+    clock = time.time
+    start = clock()
+    for i in xrange(repeat):
+        function()
+    return (clock() - start) / repeat
+
+def table(header, rows):
+    '''Formats the results as a text table
+    @header list of column titles
+    @rows list of rows, lists of values with the same length as the header'''
+    widths = [max([len(str(r[i])) for r in rows + [header]])
+              for i in xrange(len(header))]
+    lines = ['  '.join([str(v).rjust(w) for v, w in zip(r, widths)])
+             for r in [header] + rows]
+    return '\n'.join(lines)
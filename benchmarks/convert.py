@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Coordinate conversion benchmark: world.w_to_pix called point by point,
+as the sprites did, against world.w_to_pix_array converting every point of
+the frame at once. For the 22 penguins of the table plus 1, 100 and 500
+balls.
+
+Usage: python benchmarks/convert.py [repeat]'''
+
+import sys
+from random import random
+
+import common
+import numpy
+import world
+
+PENGUINS = 22
+BALLS = [1, 100, 500]
+
+def bench_convert(points, repeat):
+    '''@returns the mean time, in seconds, of converting @points world
+    positions to pixels one by one and all at once'''
+    pos = numpy.array([(random() * 4 - 2, random() * 2 - 1, 0)
+                       for i in xrange(points)])
+    rows = list(pos)
+    w_to_pix = world.w_to_pix
+    one = common.timeit(lambda: [w_to_pix(p) for p in rows], repeat)
+    array = common.timeit(lambda: world.w_to_pix_array(pos), repeat)
+    return one, array
+
+def results(repeat=1000):
+    '''@returns (name, seconds) for both ways and every number of balls, for
+    the suite (see run.py)'''
+    r = []
+    for balls in BALLS:
+        one, array = bench_convert(PENGUINS + balls, repeat)
+        r.append(('convert.one.%d' % balls, one))
+        r.append(('convert.array.%d' % balls, array))
+    return r
+
+if __name__ == '__main__':
+    repeat = 1000
+    if len(sys.argv) > 1:
+        repeat = int(sys.argv[1])
+    rows = []
+    for balls in BALLS:
+        points = PENGUINS + balls
+        one, array = bench_convert(points, repeat)
+        rows.append([balls, points, '%.1f' % (one * 1e6),
+                     '%.1f' % (array * 1e6), '%.1fx' % (one / array)])
+    print common.table(['balls', 'points', 'us/one by one', 'us/array',
+                        'speed-up'], rows)
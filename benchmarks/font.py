@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Font benchmark: cost of Font.render with the game font, for the messages
+of the waiting and end screens, and with the debug font, for the numbers
+of the debug overlay, on the dummy display. Rendered from the text cache of
+the fonts and glyph by glyph, as the texts that aren't cached are.
+
+Usage: python benchmarks/font.py [repeat]'''
+
+import sys
+
+import common
+import globals
+
+TEXTS = [('game', 'Esperando jugadores'),
+         ('game', 'empieza en 30 segundos'),
+         ('debug', '26.0412'),
+         ('debug', 'pairs: 120 culled: 340')]
+
+def bench_font(font, text, repeat):
+    '''@returns the mean time, in seconds, of rendering @text with the
+    @font, game or debug, from its cache and glyph by glyph'''
+    common.init_display()
+    f = {'game': globals.font, 'debug': globals.debug_font}[font]
+    display = common.tuzbolin.display
+    cached = common.timeit(lambda: f.render(display, text, (0, 0)), repeat)
+    size = f.cache_size
+    f.cache_size = 0
+    f.clear_cache()
+    glyphs = common.timeit(lambda: f.render(display, text, (0, 0)), repeat)
+    f.cache_size = size
+    return cached, glyphs
+
+def results(repeat=200):
+    '''@returns (name, seconds) for every text, for the suite (see run.py)'''
+    r = []
+    for font, text in TEXTS:
+        cached, glyphs = bench_font(font, text, repeat)
+        r.append(('font.%s.%d' % (font, len(text)), cached))
+        r.append(('font.%s.%d.glyphs' % (font, len(text)), glyphs))
+    return r
+
+if __name__ == '__main__':
+    repeat = 200
+    if len(sys.argv) > 1:
+        repeat = int(sys.argv[1])
+    rows = []
+    for font, text in TEXTS:
+        cached, glyphs = bench_font(font, text, repeat)
+        rows.append([font, repr(text), '%.1f' % (cached * 1e6),
+                     '%.1f' % (glyphs * 1e6)])
+    print common.table(['font', 'text', 'us/cached', 'us/glyphs'], rows)
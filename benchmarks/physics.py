@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Physics benchmark: cost of a whole simulation step (forces, space.collide
+with the ccback contacts, world.step and the snapshot read) with 1, 10, 100
+and 200 balls on the table, with the engine, space and bars of the config
+file. The collide and world.step parts are taken apart.
+
+Usage: python benchmarks/physics.py [steps]'''
+
+import sys
+
+import common
+import globals
+import world
+
+BALLS = [1, 10, 100, 200]
+
+def bench_physics(balls, steps):
+    '''@returns the mean time, in seconds, of a simulation step and of the
+    collide and world.step calls on it'''
+    common.headless_table(max_balls=balls)
+    common.add_balls(balls - len(globals.balls))
+    match = common.tuzbolin.Match()
+    dt = match.stepper.dt
+    for i in xrange(10):
+        match.sim_step(dt)
+    
+    stats = world.stats
+    stats['collide_time'] = stats['world_time'] = 0.0
+    stats['collides'] = stats['world_steps'] = 0
+    step = common.timeit(lambda: match.sim_step(dt), steps)
+    # substeps run the collisions and world.step more than once
+    return (step, stats['collide_time'] / max((1, stats['collides'])),
+            stats['world_time'] / max((1, stats['world_steps'])))
+
+def results(steps=200):
+    '''@returns (name, seconds) for every number of balls, for the suite
+    (see run.py)'''
+    r = []
+    for balls in BALLS:
+        step, collide, w_step = bench_physics(balls, steps)
+        r.append(('physics.sim_step.%d' % balls, step))
+        r.append(('physics.collide.%d' % balls, collide))
+        r.append(('physics.world_step.%d' % balls, w_step))
+    return r
+
+if __name__ == '__main__':
+    steps = 200
+    if len(sys.argv) > 1:
+        steps = int(sys.argv[1])
+    rows = []
+    for balls in BALLS:
+        step, collide, w_step = bench_physics(balls, steps)
+        rows.append([balls, '%.1f' % (step * 1e6), '%.1f' % (collide * 1e6),
+                     '%.1f' % (w_step * 1e6)])
+    print common.table(['balls', 'us/sim_step', 'us/collide', 'us/world.step'],
+                       rows)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Rendering benchmark, on the dummy display: cost of redrawing every
+penguin bar (PenguinBar.update placing its penguin sprites) and of drawing a
+whole frame, the balls, penguins and assets sprite groups, with 1, 10, 100
+and 400 balls.
+Also of merging the dirty rects of the frame (see dirty.py), next to the
+pixels that saves to display.update. It checks that the hud gives no rects
+on a frame where neither the timer nor the score changed.
+
+Usage: python benchmarks/render.py [frames]'''
+
+import sys
+
+import common
+import globals
+import world
+import dirty
+
+BALLS = [1, 10, 100, 400] # 400 as on the --balls stress test
+
+def bench_render(balls, frames):
+    '''@returns the mean time, in seconds, of updating every bar with a
+    redraw, of drawing the sprites of a frame and of merging their rects,
+    and the pixels to update before and after merging them'''
+    common.display_table(max_balls=balls)
+    common.add_balls(balls - len(globals.balls))
+    match = common.tuzbolin.Match()
+    tuzbolin = common.tuzbolin
+    dt = match.stepper.dt
+    for i in xrange(10):
+        tuzbolin.advance(globals.bars, globals.balls, globals.assets,
+                         match.stepper, match.sim_step, dt, 1000)
+    
+    bars = globals.bars.sprites()
+    def update_bars():
+        for bar in bars:
+            bar.updated = False # as if it had moved
+            bar.update(0)
+    
+    display = tuzbolin.display
+    groups = (globals.balls, globals.penguins, globals.assets)
+    def draw():
+        for group in groups:
+            group.clear(display, tuzbolin.field_bg)
+        rects = []
+        for group in groups:
+            rects += group.draw(display)
+        return rects
+    
+    rects = draw()
+    merge = common.timeit(lambda: dirty.coalesce(rects), frames)
+    return (common.timeit(update_bars, frames), common.timeit(draw, frames),
+            merge, dirty.pixels(rects), dirty.pixels(dirty.coalesce(rects)))
+
+def unchanged_hud():
+    '''@returns the rects the hud (see dirty.ChangedUpdates) gives on a frame
+    where the text of the timer and the score are the same as on the last
+    one, and nothing is drawn over them. There should be none'''
+    common.display_table()
+    tuzbolin = common.tuzbolin
+    display, bg = tuzbolin.display, tuzbolin.field_bg
+    # the timer is shown all along the last minute
+    globals.time_limit = world.ticks() + 30000
+    hud = globals.hud
+    rects = []
+    for frame in xrange(2):
+        hud.update(0)
+        hud.clear(display, bg)
+        rects = hud.draw(display)
+    globals.time_limit = 0
+    return rects
+
+def check_hud():
+    '''Raises an AssertionError if the hud draws on an unchanged frame'''
+    rects = unchanged_hud()
+    if rects:
+        raise AssertionError('the hud gave %d rects on an unchanged frame: %s'
+                             % (len(rects), rects))
+
+def results(frames=100):
+    '''@returns (name, seconds) for every number of balls, for the suite
+    (see run.py)'''
+    check_hud()
+    r = []
+    for balls in BALLS:
+        bars, draw, merge, raw, merged = bench_render(balls, frames)
+        r.append(('render.bars.%d' % balls, bars))
+        r.append(('render.draw.%d' % balls, draw))
+        r.append(('render.coalesce.%d' % balls, merge))
+    return r
+
+if __name__ == '__main__':
+    frames = 100
+    if len(sys.argv) > 1:
+        frames = int(sys.argv[1])
+    check_hud()
+    rows = []
+    for balls in BALLS:
+        bars, draw, merge, raw, merged = bench_render(balls, frames)
+        rows.append([balls, '%.1f' % (bars * 1e6), '%.1f' % (draw * 1e6),
+                     '%.1f' % (merge * 1e6), raw, merged,
+                     '%.1f' % (100.0 * (raw - merged) / max((1, raw)))])
+    # the time spent merging the rects next to the pixels it saves
+    print common.table(['balls', 'us/bars update', 'us/draw', 'us/coalesce',
+                        'pixels', 'merged pixels', '% saved'], rows)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Runs the whole benchmark suite and writes the results as json, the mean
+seconds of every measure, to compare them with a baseline from an earlier
+run. A measure slower than the baseline by more than the tolerance is a
+regression, and makes it exit with status 1, so it can be run before
+deploying:
+    python benchmarks/run.py --save benchmarks/baseline.json    (once)
+    python benchmarks/run.py --baseline benchmarks/baseline.json
+Run it on the same machine the baseline was taken on. See --help.'''
+
+import sys
+import json
+import time
+import platform
+from optparse import OptionParser
+
+import common
+import globals
+import world
+import physics
+import collide
+import bars
+import convert
+import render
+import font
+import wiimote
+import startup
+
+# benchmark -> (module, repeat for a full run, for a quick one)
+SUITE = [('physics', physics, 200, 20),
+         ('collide', collide, 200, 20),
+         ('bars', bars, 200, 20),
+         ('convert', convert, 1000, 100),
+         ('render', render, 100, 10),
+         ('font', font, 200, 20),
+         ('wiimote', wiimote, 5000, 500),
+         ('startup', startup, 5, 1)]
+
+def run_suite(quick=False, only=None):
+    '''Runs the benchmarks, every one or the @only names
+    @quick for fewer repeats, for a fast check of the suite itself
+    @returns a dict with the results, name -> seconds, and the environment'''
+    results = {}
+    for name, module, repeat, quick_repeat in SUITE:
+        if only and name not in only:
+            continue
+        print >> sys.stderr, 'running %s...' % name
+        for measure, seconds in module.results(quick and quick_repeat or repeat):
+            results[measure] = seconds
+    return {'results': results,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'machine': platform.node(),
+            'python': platform.python_version(),
+            'engine': world.ENGINE,
+            'space': globals.config['physics']['space'],
+            'bars': globals.config['physics']['bars']}
+
+def compare(report, baseline, tolerance):
+    '''Compares the @report results with the @baseline ones
+    @tolerance is the part a measure can be slower without being a regression
+    @returns the rows of the comparison table and the regressions'''
+    rows = []
+    regressions = []
+    new = report['results']
+    old = baseline['results']
+    for measure in sorted(new):
+        if measure not in old:
+            rows.append([measure, '-', '%.1f' % (new[measure] * 1e6), 'new'])
+            continue
+        ratio = new[measure] / old[measure]
+        verdict = ''
+        if ratio > 1 + tolerance:
+            verdict = 'REGRESSION'
+            regressions.append(measure)
+        elif ratio < 1 - tolerance:
+            verdict = 'faster'
+        rows.append([measure, '%.1f' % (old[measure] * 1e6),
+                     '%.1f' % (new[measure] * 1e6), '%.2fx %s' % (ratio, verdict)])
+    return rows, regressions
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='python benchmarks/run.py [options] [benchmark...]')
+    parser.add_option('--quick', action='store_true', default=False,
+                      help='fewer repeats, to check the suite runs')
+    parser.add_option('--output', help='write the results to this json file')
+    parser.add_option('--save', help='write the results as the baseline to '
+                                     'this json file')
+    parser.add_option('--baseline', help='compare the results with this json '
+                                         'file, exit with 1 on regressions')
+    parser.add_option('--tolerance', type='float', default=0.2,
+                      help='part a measure can be slower than the baseline '
+                           '(default 0.2)')
+    options, args = parser.parse_args()
+    
+    report = run_suite(options.quick, args)
+    text = json.dumps(report, indent=1, sort_keys=True)
+    for path in (options.output, options.save):
+        if path:
+            open(path, 'w').write(text)
+    
+    if not options.baseline:
+        if not (options.output or options.save):
+            print text
+        sys.exit(0)
+    
+    baseline = json.load(open(options.baseline))
+    rows, regressions = compare(report, baseline, options.tolerance)
+    print common.table(['measure', 'baseline us', 'us', 'ratio'], rows)
+    if regressions:
+        print '%d regressions over %d%%: %s' % (len(regressions),
+                                                options.tolerance * 100,
+                                                ', '.join(regressions))
+        sys.exit(1)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Startup benchmark: cold start of the game, from launching python to a
+table ready to play (imports, config, the world, the sprites and their
+images) on the dummy display. Each run is a new python process.
+
+Usage: python benchmarks/startup.py [runs]'''
+
+import os
+import sys
+import time
+import subprocess
+
+import common
+
+def bench_startup(runs):
+    '''@returns the mean time, in seconds, of a cold start'''
+    child = [sys.executable, os.path.abspath(__file__), '--child']
+    total = 0.0
+    for i in xrange(runs):
+        start = time.time()
+        subprocess.check_call(child)
+        total += time.time() - start
+    return total / runs
+
+def results(runs=5):
+    '''@returns (name, seconds) for the suite (see run.py)'''
+    return [('startup.cold', bench_startup(runs))]
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--child']:
+        common.display_table()
+        sys.exit(0)
+    runs = 5
+    if len(sys.argv) > 1:
+        runs = int(sys.argv[1])
+    print common.table(['ms/startup'], [['%.1f' % (bench_startup(runs) * 1e3)]])
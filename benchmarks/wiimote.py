@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Wiimote input benchmark: throughput of IRController.callback, the cwiid
+callback of the wiimotes, fed with synthetic IR packets of four sources (two
+pairs, a bar control each) moving a bit on every packet. No wiimote is
+needed, but the cwiid module is, for its constants.
+
+Usage: python benchmarks/wiimote.py [packets]'''
+
+import sys
+from random import random, seed
+
+import common
+import control
+
+def packets(n):
+    '''@returns @n cwiid message lists with an IR message each'''
+    seed(0)
+    r = []
+    for i in xrange(n):
+        sources = []
+        for x, y in ((200, 300), (300, 320), (700, 300), (800, 280)):
+            sources.append({'pos': (x + int(random() * 20), y + int(random() * 20)),
+                            'size': 3})
+        r.append([(control.cwiid.MESG_IR, sources)])
+    return r
+
+def bench_wiimote(n):
+    '''@returns the mean time, in seconds, of a callback call, None if cwiid
+    is not installed'''
+    if not control.cwiid:
+        return None
+    con = control.IRController()
+    data = packets(n)
+    # the controller tells the pairs apart on the first packets
+    while not con.points_ordered:
+        con.get_controls(data[0][0][1])
+    
+    i = [0]
+    def callback():
+        con.callback(data[i[0]])
+        i[0] += 1
+    return common.timeit(callback, n)
+
+def results(n=5000):
+    '''@returns (name, seconds) for the suite (see run.py), nothing without
+    cwiid'''
+    t = bench_wiimote(n)
+    if t is None:
+        print >> sys.stderr, 'wiimote: cwiid is not installed, skipped'
+        return []
+    return [('wiimote.ir_callback', t)]
+
+if __name__ == '__main__':
+    n = 5000
+    if len(sys.argv) > 1:
+        n = int(sys.argv[1])
+    t = bench_wiimote(n)
+    if t is None:
+        print 'cwiid is not installed'
+    else:
+        print common.table(['us/callback', 'packets/s'],
+                           [['%.1f' % (t * 1e6), '%d' % (1 / t)]])
@@ -21,13 +21,17 @@
 ''' This module will hold the controlling logic and wiimote interaction. Game controlling mainly will be based on wiimote interface but basic keyboard controlling
 is also possible. '''
 import pygame
-import cwiid
-import ode
+try:
+    import cwiid
+except ImportError: # no wiimotes, only keyboard and ai controllers
+    cwiid = None
 import math
+from random import random
 from pygame.locals import *
 
 import actors
 import globals
+import timeline
 
 class Controller:
     '''Base controller class'''
@@ -39,6 +43,10 @@ class Controller:
     def control(self, actor, args):
         pass
 
+    def reset(self):
+        '''Forgets whatever was left from the last match'''
+        pass
+
 class KeyController(Controller):
     '''Testing keyboard controller'''
     def __init__(self, keymap={'up': K_UP, 'down': K_DOWN,
@@ -72,6 +80,91 @@ class KeyController(Controller):
         actor.slide(self.slide)
         actor.rotate(self.rot)
 
+class AIController(Controller):
+    '''Plays on its own: slides the bar to put its nearest penguin in front of
+    the nearest ball and swings the bar when the ball is within reach.
+    Used on the headless simulations, where there is nobody to play'''
+    def __init__(self, reach=0.15, speed=0.1):
+        '''@reach is the distance on the x axis, in world units, from which
+        the penguins try to kick the ball
+        @speed is the max change on the slide on each control call, (0, 1]'''
+        Controller.__init__(self)
+        self.reach = reach
+        self.speed = speed
+        self.kick = 1
+        self.near = False # the ball was within reach on the last call
+
+    def reset(self):
+        self.slide = 0
+        self.rot = 0
+        self.kick = 1
+        self.near = False
+
+    def control(self, actor, args):
+        '''Actor is a PenguinBar here'''
+        bx = actor.bar_pos[0]
+        snapshot = globals.snapshot
+        # the nearest ball is in the lane of the bar, if there is any there
+        lane = snapshot.lane(actor)
+        if len(lane):
+            balls = snapshot.ball_pos[lane]
+        else:
+            balls = snapshot.ball_pos[snapshot.ball_active]
+        if not len(balls):
+            return
+        ball = balls[abs(balls[:, 0] - bx).argmin()]
+        
+        # nearest penguin to the ball along the bar
+        ys = snapshot.penguins(actor)[:, 1]
+        py = ys[abs(ys - ball[1]).argmin()]
+        
+        # slide is inverted for the team 1, see PenguinBar.slide
+        d = (ball[1] - py) / actor.max_extent
+        if actor.team == 1:
+            d = -d
+        d = max((-self.speed, min((self.speed, d))))
+        self.slide = max((-1, min((1, self.slide + d))))
+        
+        # a swing goes on while the ball is within reach, the next one is
+        # the other way round
+        near = abs(ball[0] - bx) < self.reach
+        if near and not self.near:
+            self.kick = -self.kick
+        self.near = near
+        if near:
+            self.rot = self.kick
+        else:
+            self.rot = 0
+        
+        actor.slide(self.slide)
+        actor.rotate(self.rot)
+
+class ScriptedController(Controller):
+    '''Plays a fixed list of moves, one on each control call, starting over
+    when it runs out of them. Gives repeatable matches on the headless
+    simulations'''
+    def __init__(self, script=None, length=100):
+        '''@script list of (slide, rot) pairs, both in [-1, 1]. If not given
+        a random one of @length moves is made up, seed the random module
+        to repeat it'''
+        Controller.__init__(self)
+        if not script:
+            script = [(random() * 2 - 1, random() * 2 - 1)
+                      for i in xrange(length)]
+        self.script = script
+        self.index = 0
+
+    def reset(self):
+        '''Starts the script over'''
+        self.index = 0
+
+    def control(self, actor, args):
+        '''Actor is a PenguinBar here'''
+        self.slide, self.rot = self.script[self.index]
+        self.index = (self.index + 1) % len(self.script)
+        actor.slide(self.slide)
+        actor.rotate(self.rot)
+
 class WiiController(Controller):
     '''Implements bar control using a wiimote. Here, we at first search for possible wiimotes around us or we can supply mac addresses as well. After connecting 
     wiimote controllers, we setup them, read different kind of messages from them and handle game controls and logic according to these messages. 
@@ -129,6 +222,7 @@ class WiiController(Controller):
         
         self.calibration = self.wm.get_acc_cal(cwiid.EXT_NONE)
     
+    @timeline.traced('wiimote')
     def callback(self, messages):
         '''Used by the cwiid message interface, we use it to save a reference to
         the newest message list here'''
@@ -361,6 +455,7 @@ class IRController(Controller):
             self.led_on = 1
 
 
+    @timeline.traced('wiimote')
     def callback(self, messages):
         '''cwiid callback, state fetching and such'''
         for message in messages: # disconnect this wm
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Dirty rectangles coalescing. The sprite groups give a rect for each
+sprite drawn, and many of them overlap or almost touch (a ball over a bar,
+the bars next to each other...). Every rect passed to display.update is
+pushed to the screen on its own, overlaps twice, so they are merged into
+fewer and bigger regions first, as long as that doesn't push too many
+pixels that didn't change.
+The sprites that seldom change (the timer...) go on a ChangedUpdates group,
+that only gives rects for them on the frames they change.'''
+
+import pygame
+
+GAP = 8 # pixels between rects that are still merged
+WASTE = 0.3 # most part of a merged region that can be pixels not in any rect
+MAX_RECTS = 64 # more rects than these are passed on as they are
+
+def coalesce(rects, gap=GAP, waste=WASTE, max_rects=MAX_RECTS):
+    '''Merges the @rects that overlap or are closer than @gap pixels into
+    their bounding rect, while the pixels in it that are in none of them are
+    no more than @waste of its area. Merged groups are merged again with
+    the others until no more can be.
+    Above @max_rects the merging would cost more than it saves (with a lot
+    of balls most of the rects are apart), so they are returned as they are
+    @returns the list of regions to update'''
+    rects = [r for r in rects if r.w > 0 and r.h > 0]
+    if len(rects) > max_rects:
+        return rects
+    # groups as [bounding rect, pixels covered by its rects, its rects],
+    # sorted by their left side. A merged group keeps the left side of the
+    # first one, so they stay sorted and the ones starting past the right of
+    # a group can't be near it
+    rects.sort(key=lambda r: r.x)
+    groups = [[pygame.Rect(r), r.w * r.h, [pygame.Rect(r)]] for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        i = 0
+        while i < len(groups):
+            r, area, members = groups[i]
+            near = r.inflate(gap * 2, gap * 2)
+            j = i + 1
+            while j < len(groups):
+                other, other_area, other_members = groups[j]
+                if other.x >= near.right:
+                    break
+                if near.colliderect(other):
+                    u = r.union(other)
+                    total = u.w * u.h
+                    covered = area + other_area - overlap(members, other_members)
+                    if total - covered <= waste * total:
+                        r, area = u, covered
+                        members = members + other_members
+                        groups[i] = [r, area, members]
+                        del groups[j]
+                        near = r.inflate(gap * 2, gap * 2)
+                        merged = True
+                        continue
+                j += 1
+            i += 1
+    return [r for r, area, members in groups]
+
+def overlap(rects, others):
+    '''@returns the pixels where the @rects and the @others intersect, as
+    the sum of the intersections of every pair. A pixel in more than two of
+    them is counted more than once, so the pixels covered by a merged group
+    come out short of the real ones, and its merges are refused rather than
+    taken when in doubt'''
+    bounds = others[0].unionall(others)
+    total = 0
+    for r in rects:
+        if not r.colliderect(bounds):
+            continue
+        for o in others:
+            c = r.clip(o)
+            total += c.w * c.h
+    return total
+
+def pixels(rects):
+    '''@returns the pixels pushed to the screen updating the @rects'''
+    return sum([r.w * r.h for r in rects])
+
+def touched(groups):
+    '''@returns the rects the @groups of sprites will clear or draw on this
+    frame: where their sprites were drawn on the last one and where they are
+    now'''
+    rects = []
+    for group in groups:
+        rects += [r for r in group.spritedict.values() if r]
+        rects += group.lostsprites
+        rects += [s.rect for s in group]
+    return rects
+
+class ChangedUpdates(pygame.sprite.RenderUpdates):
+    '''A RenderUpdates that only clears and draws again the sprites that
+    changed, the ones with a true changed attribute (draw unsets it), so the
+    rest don't give any dirty rect. It's drawn over the other groups, that
+    could draw over its sprites: clear is called once they were updated,
+    before drawing any of them, with the rects they touch (see touched) and
+    the sprites under those are drawn again too'''
+    def __init__(self, *sprites):
+        pygame.sprite.RenderUpdates.__init__(self, *sprites)
+        self.redraw = []
+    
+    def clear(self, surface, bgd, damaged=()):
+        '''Clears the sprites that changed or are under the @damaged rects,
+        and the removed ones, with the @bgd surface. The sprites of the group
+        under the cleared ones are cleared too, to draw them all again'''
+        damaged = list(damaged) + self.lostsprites
+        for r in self.lostsprites:
+            surface.blit(bgd, r, r)
+        self.redraw = []
+        pending = self.spritedict.items()
+        found = True
+        while found:
+            found = False
+            for s, r in pending[:]:
+                if s.changed or (r and r.collidelist(damaged) != -1):
+                    if r:
+                        surface.blit(bgd, r, r)
+                        damaged.append(r)
+                    damaged.append(s.rect)
+                    self.redraw.append(s)
+                    pending.remove((s, r))
+                    found = True
+    
+    def draw(self, surface):
+        '''Draws the sprites cleared by clear
+        @returns the rects to update'''
+        dirty = self.lostsprites
+        self.lostsprites = []
+        for s in self.redraw:
+            if not self.has(s):
+                continue
+            r = self.spritedict[s]
+            new = surface.blit(s.image, s.rect)
+            if r and new.colliderect(r):
+                dirty.append(new.union(r))
+            else:
+                dirty.append(new)
+                if r:
+                    dirty.append(r)
+            self.spritedict[s] = new
+            s.changed = False
+        self.redraw = []
+        return dirty
+    
+    def repaint(self):
+        '''The whole screen was painted with the background, so every sprite
+        has to be drawn again, without clearing them'''
+        self.lostsprites = []
+        for s in self.spritedict:
+            self.spritedict[s] = 0
+            s.changed = True
@@ -0,0 +1,537 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''A small 2D physics engine made for the table, that can replace ODE.
+It implements the part of the pyode interface used by the game, so world.py
+imports it in place of the ode module when the 'engine' option of the config
+file is 'flat'. Balls and penguins are circles on the field plane, and the
+walls are lines. There are no joints, so the bars have to be kinematic.
+
+The state of the bodies is kept in arrays, one per attribute, and Body is
+just an index on them. A step integrates the forces, applies the field
+friction the way the Plane2DJoint motor of the balls does on ode, solves the
+contacts with impulses (bounce and position correction as in ode contact
+joints) and moves the bodies.
+
+Penguins hang from their bar and they swing over the balls when the bar
+turns, so the distance between geoms is measured in 3D: penguins don't
+touch the balls when they are high enough, as happens with ode.'''
+
+import math
+
+# joint parameters, only the ones of the ball friction motor matter here
+paramVel = ParamVel = 0
+paramFMax = ParamFMax = 1
+ParamLoStop = 2
+ParamHiStop = 3
+Infinity = float('inf')
+environment = None
+
+ERP = 0.2 # part of the penetration corrected on each step, as ode ERP
+ITERATIONS = 4 # impulse passes over the contacts on each step
+
+class Mass:
+    '''Mass of a body, only the total mass is used'''
+    def __init__(self):
+        self.mass = 0.0
+
+    def setSphere(self, density, radius):
+        self.mass = density * 4.0 / 3.0 * math.pi * radius ** 3
+
+    def setSphereTotal(self, total_mass, radius):
+        self.mass = total_mass
+
+    def setBoxTotal(self, total_mass, lx, ly, lz):
+        self.mass = total_mass
+
+class World:
+    '''Holds the state of every body, an array for each attribute'''
+    def __init__(self):
+        self.x, self.y, self.z = [], [], []
+        self.vx, self.vy, self.vz = [], [], []
+        self.wx, self.wy, self.wz = [], [], [] # angular velocity
+        self.q = [] # orientation quaternions
+        self.fx, self.fy = [], [] # forces added for the next step
+        self.inv_mass = []
+        self.friction = [] # max friction force, set by Plane2DJoint
+        self.enabled = []
+        self.kinematic = []
+        self.groups = [] # joint groups with contacts for the next step
+
+    def _add_body(self):
+        '''@returns the index of a new body'''
+        for a in (self.x, self.y, self.z, self.vx, self.vy, self.vz,
+                  self.wx, self.wy, self.wz, self.fx, self.fy,
+                  self.inv_mass, self.friction):
+            a.append(0.0)
+        self.q.append((1.0, 0.0, 0.0, 0.0))
+        self.enabled.append(True)
+        self.kinematic.append(False)
+        return len(self.x) - 1
+
+    def setGravity(self, gravity):
+        pass # it's a table, everything lies on it
+
+    def step(self, dt):
+        '''Advances the simulation @dt seconds'''
+        x, y, z = self.x, self.y, self.z
+        vx, vy, vz = self.vx, self.vy, self.vz
+        fx, fy = self.fx, self.fy
+        inv_mass = self.inv_mass
+        friction = self.friction
+        enabled = self.enabled
+        kinematic = self.kinematic
+        
+        # forces and the friction motor: it tries to stop the body on each
+        # axis, applying up to its max force
+        for i in xrange(len(x)):
+            if not enabled[i] or kinematic[i]:
+                continue
+            im = inv_mass[i]
+            vx[i] += fx[i] * im * dt
+            vy[i] += fy[i] * im * dt
+            dv = friction[i] * im * dt
+            if dv:
+                if vx[i] > dv: vx[i] -= dv
+                elif vx[i] < -dv: vx[i] += dv
+                else: vx[i] = 0.0
+                if vy[i] > dv: vy[i] -= dv
+                elif vy[i] < -dv: vy[i] += dv
+                else: vy[i] = 0.0
+        
+        contacts = []
+        for group in self.groups:
+            contacts += group.joints
+        if contacts:
+            self._solve(contacts, dt)
+        
+        for i in xrange(len(x)):
+            if enabled[i]:
+                x[i] += vx[i] * dt
+                y[i] += vy[i] * dt
+                z[i] += vz[i] * dt
+            fx[i] = fy[i] = 0.0
+
+    def _solve(self, contacts, dt):
+        '''Sequential impulses on the contacts. On each one the bodies get
+        the bounce velocity, or at least the one needed to correct a part of
+        the penetration'''
+        vx, vy = self.vx, self.vy
+        inv_mass = self.inv_mass
+        
+        # per contact: bodies, normal, inverse mass sum, velocity of the
+        # kinematic bodies at the contact and target separating velocity
+        prepared = []
+        for j in contacts:
+            a, b = j.bodies
+            c = j.contact
+            nx, ny = c.normal
+            ima = imb = 0.0
+            kvx = kvy = 0.0 # relative velocity from the kinematic bodies
+            if a is not None:
+                if self.kinematic[a]:
+                    pvx, pvy = self._point_vel(a, c.pos)
+                    kvx -= pvx
+                    kvy -= pvy
+                    a = None
+                elif self.enabled[a]:
+                    ima = inv_mass[a]
+                else:
+                    a = None
+            if b is not None:
+                if self.kinematic[b]:
+                    pvx, pvy = self._point_vel(b, c.pos)
+                    kvx += pvx
+                    kvy += pvy
+                    b = None
+                elif self.enabled[b]:
+                    imb = inv_mass[b]
+                else:
+                    b = None
+            if not (ima + imb):
+                continue
+            vn = self._rel_vel(a, b, nx, ny, kvx, kvy)
+            target = ERP * c.depth / dt
+            if vn < 0:
+                target = max((target, -c.bounce * vn))
+            prepared.append((a, b, nx, ny, ima, imb, kvx, kvy, target))
+        
+        for k in xrange(ITERATIONS):
+            for a, b, nx, ny, ima, imb, kvx, kvy, target in prepared:
+                vn = self._rel_vel(a, b, nx, ny, kvx, kvy)
+                if vn >= target:
+                    continue
+                j = (target - vn) / (ima + imb)
+                if a is not None:
+                    vx[a] -= j * nx * ima
+                    vy[a] -= j * ny * ima
+                if b is not None:
+                    vx[b] += j * nx * imb
+                    vy[b] += j * ny * imb
+
+    def _rel_vel(self, a, b, nx, ny, kvx, kvy):
+        '''@returns the velocity of b relative to a along the normal'''
+        rvx, rvy = kvx, kvy
+        if a is not None:
+            rvx -= self.vx[a]
+            rvy -= self.vy[a]
+        if b is not None:
+            rvx += self.vx[b]
+            rvy += self.vy[b]
+        return rvx * nx + rvy * ny
+
+    def _point_vel(self, i, pos):
+        '''@returns the (x, y) velocity of the point @pos of the body @i'''
+        rx = pos[0] - self.x[i]
+        ry = pos[1] - self.y[i]
+        rz = pos[2] - self.z[i]
+        wx, wy, wz = self.wx[i], self.wy[i], self.wz[i]
+        return (self.vx[i] + wy * rz - wz * ry,
+                self.vy[i] + wz * rx - wx * rz)
+
+class Body:
+    '''A handle to a body stored in the arrays of the world'''
+    def __init__(self, world):
+        self.world = world
+        self.i = world._add_body()
+
+    def setPosition(self, pos):
+        w, i = self.world, self.i
+        w.x[i], w.y[i], w.z[i] = pos
+
+    def getPosition(self):
+        w, i = self.world, self.i
+        return (w.x[i], w.y[i], w.z[i])
+
+    def setLinearVel(self, vel):
+        w, i = self.world, self.i
+        w.vx[i], w.vy[i], w.vz[i] = vel
+
+    def getLinearVel(self):
+        w, i = self.world, self.i
+        return (w.vx[i], w.vy[i], w.vz[i])
+
+    def setAngularVel(self, vel):
+        w, i = self.world, self.i
+        w.wx[i], w.wy[i], w.wz[i] = vel
+
+    def getAngularVel(self):
+        w, i = self.world, self.i
+        return (w.wx[i], w.wy[i], w.wz[i])
+
+    def setQuaternion(self, q):
+        self.world.q[self.i] = tuple(q)
+
+    def getQuaternion(self):
+        return self.world.q[self.i]
+
+    def setMass(self, mass):
+        self.world.inv_mass[self.i] = mass.mass and 1.0 / mass.mass
+
+    def addForce(self, f):
+        w, i = self.world, self.i
+        w.fx[i] += f[0]
+        w.fy[i] += f[1]
+
+    def setKinematic(self):
+        '''The body moves with the velocity it's given, nothing pushes it'''
+        self.world.kinematic[self.i] = True
+
+    def enable(self):
+        self.world.enabled[self.i] = True
+
+    def disable(self):
+        self.world.enabled[self.i] = False
+
+    def isEnabled(self):
+        return self.world.enabled[self.i]
+
+def _rotate(q, v):
+    '''Rotates the vector @v by the quaternion @q (w, x, y, z)'''
+    w, qx, qy, qz = q
+    # t = 2 * cross(q.xyz, v); v' = v + w * t + cross(q.xyz, t)
+    tx = 2 * (qy * v[2] - qz * v[1])
+    ty = 2 * (qz * v[0] - qx * v[2])
+    tz = 2 * (qx * v[1] - qy * v[0])
+    return (v[0] + w * tx + qy * tz - qz * ty,
+            v[1] + w * ty + qz * tx - qx * tz,
+            v[2] + w * tz + qx * ty - qy * tx)
+
+class Geom:
+    '''Base of the geoms, with the collision bits of ode'''
+    def __init__(self, space):
+        self.body = None
+        self.space = None
+        self.enabled = True
+        self.category_bits = 0xffffffff
+        self.collide_bits = 0xffffffff
+        if space is not None:
+            space.add(self)
+
+    def setBody(self, body):
+        self.body = body
+
+    def getBody(self):
+        return self.body
+
+    def getSpace(self):
+        return self.space
+
+    def isSpace(self):
+        return False
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def isEnabled(self):
+        return self.enabled
+
+    def setCategoryBits(self, bits):
+        self.category_bits = bits
+
+    def getCategoryBits(self):
+        return self.category_bits
+
+    def setCollideBits(self, bits):
+        self.collide_bits = bits
+
+    def getCollideBits(self):
+        return self.collide_bits
+
+class GeomSphere(Geom):
+    '''A sphere, a circle on the table that may be over it'''
+    def __init__(self, space=None, radius=1.0):
+        Geom.__init__(self, space)
+        self.radius = radius
+        self.pos = (0.0, 0.0, 0.0)
+
+    def getRadius(self):
+        return self.radius
+
+    def setPosition(self, pos):
+        self.pos = tuple(pos)
+
+    def getPosition(self):
+        if self.body:
+            return self.body.getPosition()
+        return self.pos
+
+    def bounds(self):
+        '''@returns the (min x, max x, min y, max y) of the geom'''
+        x, y, z = self.getPosition()
+        r = self.radius
+        return x - r, x + r, y - r, y + r
+
+class GeomTransform(Geom):
+    '''Places a geom on its body with the offset given by the geom position,
+    as ode transform geoms do'''
+    def __init__(self, space=None):
+        Geom.__init__(self, space)
+        self.geom = None
+
+    def setGeom(self, geom):
+        self.geom = geom
+
+    def getGeom(self):
+        return self.geom
+
+    def getRadius(self):
+        return self.geom.radius
+
+    def getPosition(self):
+        b = self.body
+        offset = _rotate(b.getQuaternion(), self.geom.pos)
+        x, y, z = b.getPosition()
+        return (x + offset[0], y + offset[1], z + offset[2])
+
+    def bounds(self):
+        x, y, z = self.getPosition()
+        r = self.geom.radius
+        return x - r, x + r, y - r, y + r
+
+class GeomPlane(Geom):
+    '''A wall, the plane of points p with dot(@normal, p) = @dist'''
+    def __init__(self, space=None, normal=(0, 0, 1), dist=0):
+        Geom.__init__(self, space)
+        self.normal = tuple(normal)
+        self.dist = dist
+
+    def bounds(self):
+        return -Infinity, Infinity, -Infinity, Infinity
+
+class Space(Geom):
+    '''Collision space, the pairs are found sweeping the bounding boxes of
+    the geoms along the x axis, and testing the y axis of the ones that
+    overlap on it. Every kind of ode space is this one here'''
+    def __init__(self, space=None, *args):
+        Geom.__init__(self, space)
+        self.geoms = []
+
+    def isSpace(self):
+        return True
+
+    def add(self, geom):
+        geom.space = self
+        self.geoms.append(geom)
+
+    def remove(self, geom):
+        self.geoms.remove(geom)
+        geom.space = None
+
+    def setLevels(self, minlevel, maxlevel):
+        pass
+
+    def bounds(self):
+        return -Infinity, Infinity, -Infinity, Infinity
+
+    def collide(self, arg, callback):
+        '''Calls @callback(@arg, geom1, geom2) for every pair of geoms whose
+        bounding boxes overlap and whose collision bits match'''
+        spans = []
+        for g in self.geoms:
+            if g.enabled:
+                spans.append(g.bounds() + (g,))
+        spans.sort()
+        active = []
+        for lo, hi, ylo, yhi, g in spans:
+            active = [a for a in active if a[0] >= lo]
+            for ahi, aylo, ayhi, a in active:
+                if ylo <= ayhi and aylo <= yhi and _bits_match(a, g):
+                    callback(arg, a, g)
+            active.append((hi, ylo, yhi, g))
+
+def _bits_match(g1, g2):
+    return ((g1.category_bits & g2.collide_bits)
+            or (g2.category_bits & g1.collide_bits))
+
+SimpleSpace = HashSpace = Space
+
+def QuadTreeSpace(center, extents, depth, space=None):
+    return Space(space)
+
+def collide2(geom1, geom2, arg, callback):
+    '''Calls @callback for the geoms inside a space against the other geom'''
+    if geom2.isSpace():
+        geom1, geom2 = geom2, geom1
+    for g in geom1.geoms:
+        if g.enabled and _bits_match(g, geom2):
+            callback(arg, g, geom2)
+
+class Contact:
+    '''A contact point between two geoms. The normal points from the first
+    geom to the second one'''
+    def __init__(self, pos, normal, depth, geom1, geom2):
+        self.pos = pos
+        self.normal = normal
+        self.depth = depth
+        self.geoms = (geom1, geom2)
+        self.bounce = 0.0
+        self.mu = 0.0
+
+    def setBounce(self, bounce):
+        self.bounce = max((bounce, 0.0))
+
+    def setMu(self, mu):
+        self.mu = mu # no friction between geoms on this engine
+
+    def getContactGeomParams(self):
+        return self.pos, self.normal, self.depth, self.geoms[0], self.geoms[1]
+
+def collide(geom1, geom2):
+    '''Tests two geoms for collision
+    @returns a list with their contact, empty if they don't touch'''
+    if isinstance(geom1, GeomPlane):
+        c = _sphere_plane(geom2, geom1)
+        if c:
+            c.normal = (-c.normal[0], -c.normal[1])
+            c.geoms = (geom1, geom2)
+            return [c]
+        return []
+    if isinstance(geom2, GeomPlane):
+        c = _sphere_plane(geom1, geom2)
+        return c and [c] or []
+    
+    x1, y1, z1 = geom1.getPosition()
+    x2, y2, z2 = geom2.getPosition()
+    dx = x2 - x1
+    dy = y2 - y1
+    dz = z2 - z1
+    r = geom1.getRadius() + geom2.getRadius()
+    d2 = dx * dx + dy * dy + dz * dz
+    if d2 >= r * r:
+        return []
+    # the normal lies on the table, the balls can't leave it
+    dxy = math.sqrt(dx * dx + dy * dy)
+    if dxy:
+        normal = (dx / dxy, dy / dxy)
+    else:
+        normal = (1.0, 0.0)
+    pos = (x1 + dx / 2.0, y1 + dy / 2.0, z1 + dz / 2.0)
+    return [Contact(pos, normal, r - math.sqrt(d2), geom1, geom2)]
+
+def _sphere_plane(sphere, plane):
+    '''@returns the contact of a sphere with a wall, None if they don't
+    touch. The normal points to the wall'''
+    x, y, z = sphere.getPosition()
+    nx, ny, nz = plane.normal
+    depth = sphere.getRadius() - (x * nx + y * ny + z * nz - plane.dist)
+    if depth <= 0:
+        return None
+    return Contact((x - nx * sphere.getRadius(), y - ny * sphere.getRadius(), z),
+                   (-nx, -ny), depth, sphere, plane)
+
+class JointGroup:
+    '''Holds contact joints until it's emptied'''
+    def __init__(self):
+        self.joints = []
+
+    def empty(self):
+        del self.joints[:]
+
+class ContactJoint:
+    '''Keeps two bodies from going through each other at a contact'''
+    def __init__(self, world, group, contact):
+        self.contact = contact
+        self.bodies = (None, None)
+        group.joints.append(self)
+        if group not in world.groups:
+            world.groups.append(group)
+
+    def attach(self, body1, body2):
+        self.bodies = (body1 and body1.i, body2 and body2.i)
+
+class Plane2DJoint:
+    '''Keeps a body on the table. Only its velocity motors are simulated, as
+    they are the field friction of the balls'''
+    def __init__(self, world):
+        self.world = world
+        self.body = None
+
+    def attach(self, body1, body2):
+        self.body = body1
+
+    def setXParam(self, param, value):
+        if param == ParamFMax and self.body:
+            self.world.friction[self.body.i] = value
+
+    setYParam = setXParam
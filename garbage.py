@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Garbage collection scheduling. The cyclic garbage collector of python
+runs whenever enough objects were allocated, and every frame allocates a
+lot of them (rects, tuples, lists of dirty rects...), so it would run in the
+middle of the frames making them late. Here it's paused while playing and
+run on the time left at the end of the frames instead, with the full
+collections kept for the moments when a late frame doesn't matter.'''
+
+import gc
+import time
+
+class Scheduler:
+    '''Runs the garbage collections between frames. While playing (see
+    play) the automatic collections are disabled and idle runs the young
+    generations in the slack of the frames. The full ones are run when the
+    play stops (see pause) or after a goal (see request_full)'''
+    OVERDUE = 4 # times the gen 0 threshold that makes idle collect anyway
+    
+    def __init__(self):
+        self.state = None # 'play' or 'pause'
+        self.full_pending = False
+        self.threshold = gc.get_threshold()
+        self.cost = [0.0005, 0.002, 0.01] # estimated seconds per generation
+    
+    def play(self):
+        '''The match is being played, frames must be on time'''
+        if self.state != 'play':
+            self.state = 'play'
+            gc.disable()
+    
+    def pause(self):
+        '''Nobody is playing (end of match, waiting players), a full
+        collection is run and the automatic ones are back'''
+        if self.state != 'pause':
+            self.state = 'pause'
+            self.full_pending = False
+            gc.enable()
+            self.collect(2)
+    
+    def request_full(self):
+        '''A full collection will be run on the next idle, the goal animation
+        is on the screen so a late frame won't be noticed'''
+        self.full_pending = True
+    
+    def idle(self, slack):
+        '''Runs the collections that fit in the @slack seconds left to the
+        frame. The gen 0 and gen 1 ones run anyway if they got overdue, so
+        the garbage can't pile up while the frames are late
+        @returns the seconds spent'''
+        if self.state != 'play':
+            return 0.0
+        if self.full_pending:
+            self.full_pending = False
+            return self.collect(2)
+        count = gc.get_count()
+        if count[0] < self.threshold[0]:
+            return 0.0
+        if count[1] >= self.threshold[1] and (
+                slack > self.cost[1]
+                or count[1] >= self.OVERDUE * self.threshold[1]):
+            return self.collect(1)
+        if slack > self.cost[0] or count[0] >= self.OVERDUE * self.threshold[0]:
+            return self.collect(0)
+        return 0.0
+    
+    def collect(self, generation):
+        '''Collects the @generation, learning how long it takes
+        @returns the seconds spent'''
+        start = time.time()
+        gc.collect(generation)
+        spent = time.time() - start
+        self.cost[generation] = 0.8 * self.cost[generation] + 0.2 * spent
+        return spent
@@ -51,6 +51,37 @@ sound = config['sound']
 debug = config['debug']
 fps = config['fps']
 
+## pixels in a world unit (see world.w_to_pix)
+PIXELS_PER_UNIT = float(config['physics']['pixels_per_unit'])
+
+## fixed simulation step, the physics run at this rate whatever the fps
+PHYSICS_RATE = float(config['physics']['rate'])
+PHYSICS_DT = 1.0 / PHYSICS_RATE
+MAX_SUBSTEPS = config['physics']['max_substeps']
+
+## running without display, only the simulation (see tuzbolin --headless)
+headless = 0
+## seconds simulated since the start, the game clock (see world.ticks)
+sim_time = 0.0
+## the balls on the table, a sprite group (see tuzbolin.startup)
+balls = None
+## sprites drawn only on the frames they change (see dirty.ChangedUpdates)
+hud = None
+## penguin sprites of the bars (see actors.PenguinBar)
+penguins = None
+## the state of the table after the last simulation step (see world.Snapshot)
+snapshot = None
+## the frame profiler (see profiler.py)
+profiler = None
+## the garbage collection scheduler (see garbage.py)
+gc_scheduler = None
+## the frame timeline recorder, None when not recording (see timeline.py)
+timeline = None
+## goals scored in the current match, as (world.ticks(), goal index)
+goal_log = []
+## world.ticks() when the match ends, 0 until it starts (see tuzbolin.advance)
+time_limit = 0
+
 ## Game states
 ST_WAITING = 0
 ST_PLAYING = 1
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Frame profiler: times every phase of the playing frames and counts the
+work of the simulation on them, keeping the last frames in a ring of numpy
+arrays. It's cheap enough to be always on, a couple of clock reads per
+phase, and its HUD (see Profiler.draw) shows the percentiles of each phase
+and a sparkline of the frame times.
+When there is a timeline recorder the phases are recorded on it too.'''
+
+import time
+import numpy
+import pygame
+import globals
+
+# phases of a frame, in order. collide and step are the space.collide and
+# world.step calls of every simulation step of the frame, sim the rest of
+# the simulation (forces, snapshot reads, substeps). gc is the garbage
+# collected on the slack of the frame (see garbage.py)
+PHASES = ('clear', 'update', 'collide', 'step', 'sim', 'draw', 'flip', 'gc')
+# counters of a frame: simulation steps run, pairs tested on ccback and
+# contact joints created, and the regions and pixels sent to display.update
+COUNTERS = ('steps', 'pairs', 'contacts', 'rects', 'pixels')
+
+HUD_SIZE = (330, 200)
+HUD_BG = (0, 0, 0)
+HUD_LINE = (255, 255, 0)
+
+class Profiler:
+    '''Times the phases of each frame. A frame is timed between start and
+    end, each phase lasting since the previous lap (see lap)'''
+    def __init__(self, frames=120):
+        '''@frames is the number of frames kept for the statistics'''
+        self.frames = frames
+        self.times = numpy.zeros((frames, len(PHASES)))
+        self.counts = numpy.zeros((frames, len(COUNTERS)), int)
+        self.recorded = 0
+        self.index = dict([(p, i) for i, p in enumerate(PHASES)])
+        self.count_index = dict([(c, i) for i, c in enumerate(COUNTERS)])
+        self.row = numpy.zeros(len(PHASES))
+        self.count_row = numpy.zeros(len(COUNTERS), int)
+        self.last = 0.0
+        self.show = globals.config['profiler']
+    
+    def start(self):
+        '''A new frame begins'''
+        self.row[:] = 0
+        self.count_row[:] = 0
+        self.last = self.frame_start = time.time()
+    
+    def lap(self, phase):
+        '''The @phase ends now, it lasted since the previous lap'''
+        now = time.time()
+        self.row[self.index[phase]] += now - self.last
+        if globals.timeline:
+            globals.timeline.span(phase, self.last, now)
+        self.last = now
+    
+    def simulation(self, steps, pairs, contacts, collide, step):
+        '''The simulation of the frame ends now. It ran @steps steps, with
+        @pairs tested for collision and @contacts contact joints created,
+        spending @collide seconds on space.collide and @step on world.step'''
+        self.lap('sim')
+        row = self.row
+        row[self.index['sim']] -= collide + step
+        row[self.index['collide']] += collide
+        row[self.index['step']] += step
+        self.count_row[:3] += (steps, pairs, contacts)
+    
+    def count(self, counter, n):
+        '''Adds @n to the @counter of the frame'''
+        self.count_row[self.count_index[counter]] += n
+    
+    def end(self):
+        '''The frame is over, its times are recorded'''
+        i = self.recorded % self.frames
+        self.times[i] = self.row
+        self.counts[i] = self.count_row
+        self.recorded += 1
+        if globals.timeline:
+            globals.timeline.span('frame', self.frame_start, time.time())
+    
+    def last_frames(self):
+        '''@returns the times and counts of the recorded frames, oldest first'''
+        n = min((self.recorded, self.frames))
+        i = self.recorded % self.frames
+        if n < self.frames:
+            return self.times[:n], self.counts[:n]
+        order = numpy.r_[i:self.frames, 0:i]
+        return self.times[order], self.counts[order]
+    
+    def percentiles(self, q=(50, 95)):
+        '''@returns a (len(q) + 1, phases) array with the @q percentiles of
+        every phase and the max, in seconds'''
+        times = self.last_frames()[0]
+        if not len(times):
+            return numpy.zeros((len(q) + 1, len(PHASES)))
+        return numpy.vstack((numpy.percentile(times, q, axis=0),
+                             times.max(axis=0)))
+    
+    def draw(self, surface, font, pos):
+        '''Draws the HUD: p50, p95 and max of every phase in milliseconds,
+        the counters per step and a sparkline with the time of the last
+        frames, the frame budget at the middle of its height
+        @returns the rect drawn'''
+        rect = pygame.Rect(pos, HUD_SIZE)
+        surface.fill(HUD_BG, rect)
+        times, counts = self.last_frames()
+        p = self.percentiles() * 1000
+        x, y = pos
+        font.render(surface, 'phase    p50    p95    max', (x, y))
+        for i, phase in enumerate(PHASES):
+            y += 15
+            font.render(surface, '%-7s %5.1f  %5.1f  %5.1f' %
+                        (phase, p[0, i], p[1, i], p[2, i]), (x, y))
+        y += 15
+        steps = max((counts[:, 0].sum(), 1))
+        font.render(surface, 'per step: %d pairs %d contacts' %
+                    (counts[:, 1].sum() / steps, counts[:, 2].sum() / steps),
+                    (x, y))
+        y += 15
+        frames = max((len(counts), 1))
+        font.render(surface, 'per frame: %d rects %d kpixels' %
+                    (counts[:, 3].sum() / frames,
+                     counts[:, 4].sum() / frames / 1000), (x, y))
+        
+        # sparkline
+        y += 18
+        h = rect.bottom - y
+        totals = times.sum(axis=1)
+        if len(totals) > 1:
+            budget = 1.0 / globals.FPS
+            ys = y + h - numpy.minimum(totals / (2 * budget), 1) * h
+            xs = x + numpy.arange(len(totals)) * (HUD_SIZE[0] - 1) / float(self.frames)
+            pygame.draw.line(surface, (128, 128, 128), (x, y + h / 2),
+                             (rect.right, y + h / 2))
+            pygame.draw.lines(surface, HUD_LINE, False, zip(xs, ys))
+        return rect
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Authors:
+#   Félix del Rio Benigno <fario@emergya.es>
+#
+# Copyright 2008 Emergya, sca. (www.emergya.es)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 2 of the GNU General Public
+# License as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''Frame timeline recorder: writes spans of time (the phases of the frames,
+the simulation steps, the input callbacks...) to a file, to look at the
+frames of a session offline. The file is in Chrome trace_event format, to be
+loaded on chrome://tracing, or JSON lines, an event per line.
+Events are written in batches and the files are rotated once they reach
+a size, keeping the last ones, so it can be left on in a kiosk.'''
+
+import os
+import time
+import json
+import thread
+import globals
+
+class Recorder:
+    '''Records spans to @path. A span is a Chrome trace_event complete
+    event: name, category, start and duration in microseconds since the
+    recorder was created, process and thread'''
+    def __init__(self, path, max_bytes=16 << 20, backups=3, buffer=512):
+        '''@path of the file, JSON lines if it ends in .jsonl
+        @max_bytes the size at which the file is rotated, to path.1, path.1
+        to path.2 and so on
+        @backups is the number of rotated files kept
+        @buffer is the number of events kept before writing them'''
+        self.path = path
+        self.jsonl = path.endswith('.jsonl')
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.buffer = buffer
+        self.events = []
+        self.lock = thread.allocate_lock() # input callbacks come from other threads
+        self.pid = os.getpid()
+        self.origin = time.time()
+        self.file = None
+        self._open()
+    
+    def span(self, name, start, end, cat='frame'):
+        '''Records the span @name from @start to @end, time.time() values'''
+        event = {'name': name, 'cat': cat, 'ph': 'X',
+                 'ts': int((start - self.origin) * 1e6),
+                 'dur': int((end - start) * 1e6),
+                 'pid': self.pid, 'tid': thread.get_ident()}
+        self.lock.acquire()
+        self.events.append(event)
+        if len(self.events) >= self.buffer:
+            self._write()
+        self.lock.release()
+    
+    def flush(self):
+        '''Writes the events recorded so far'''
+        self.lock.acquire()
+        self._write()
+        self.file.flush()
+        self.lock.release()
+    
+    def close(self):
+        '''Writes the events left and closes the file'''
+        self.lock.acquire()
+        self._write()
+        self._close()
+        self.lock.release()
+    
+    def _open(self):
+        self.file = open(self.path, 'w')
+        self.size = 0
+        self.count = 0 # events on the file
+        if not self.jsonl:
+            # a json array, the closing bracket is optional for chrome so
+            # the file can be read even if the game didn't close it
+            self.file.write('[\n')
+    
+    def _close(self):
+        if not self.jsonl:
+            self.file.write('\n]\n')
+        self.file.close()
+    
+    def _write(self):
+        if not self.events:
+            return
+        if self.jsonl:
+            text = ''.join([json.dumps(e) + '\n' for e in self.events])
+        else:
+            text = ',\n'.join([json.dumps(e) for e in self.events])
+            if self.count:
+                text = ',\n' + text
+        self.file.write(text)
+        self.size += len(text)
+        self.count += len(self.events)
+        self.events = []
+        if self.size >= self.max_bytes:
+            self._rotate()
+    
+    def _rotate(self):
+        '''Moves the file to path.1 (and path.1 to path.2...) and starts a
+        new one'''
+        self._close()
+        for i in xrange(self.backups - 1, 0, -1):
+            name = '%s.%d' % (self.path, i)
+            if os.path.exists(name):
+                os.rename(name, '%s.%d' % (self.path, i + 1))
+        if self.backups:
+            os.rename(self.path, self.path + '.1')
+        self._open()
+
+def traced(name, cat='input'):
+    '''Decorator recording every call to a function as a span @name, when
+    there is a recorder on globals.timeline'''
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            if not globals.timeline:
+                return function(*args, **kwargs)
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                globals.timeline.span(name, start, time.time(), cat)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
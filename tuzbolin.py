@@ -24,29 +24,43 @@
 
 import pygame
 import sys
-import ode
+import math
+import time
 import yaml
+from optparse import OptionParser
 from pygame.locals import *
 from random import random
 
 import globals
 import world
+from world import ode
 import actors
 import control
+import profiler
+import garbage
+import timeline
+from dirty import coalesce, pixels, touched, ChangedUpdates
 
 _running = 1
 
-def startup():
+def startup(headless_controller=control.AIController, ai_players=0):
     '''Inits everything and loads what's needed to start playing
     @bars, @balls and @assets are sprite groups that are going to implement various actions on included sprite instances like add, remove, collision detection etc.   
+    @headless_controller is the controller class playing every bar when
+    running headless
+    @ai_players to have every bar played by a headless_controller even with
+    the display on (see stress_loop)
     '''
     # init playfield (4 walls, consist of ode.GeomPlane instances as they don't move , just hold other objects between them. )
     dwidth = -world.pix_to_dist(globals.FIELD_SIZE[0] / 2.0)
     dheight = -world.pix_to_dist(globals.FIELD_SIZE[1] / 2.0)
-    north = ode.GeomPlane(globals.ode_space, (0, -1, 0), dheight)
-    south = ode.GeomPlane(globals.ode_space, (0, 1, 0), dheight)
-    west = ode.GeomPlane(globals.ode_space, (1, 0, 0), dwidth)
-    east = ode.GeomPlane(globals.ode_space, (-1, 0, 0), dwidth)
+    static = globals.ode_static_space
+    north = ode.GeomPlane(static, (0, -1, 0), dheight)
+    south = ode.GeomPlane(static, (0, 1, 0), dheight)
+    west = ode.GeomPlane(static, (1, 0, 0), dwidth)
+    east = ode.GeomPlane(static, (-1, 0, 0), dwidth)
+    for wall in (north, south, west, east):
+        world.set_material(wall, 'wall')
     
     # goals: two pygame rects we will test against the ball on its update method
     goal_left = pygame.Rect((0, 0), globals.GOAL_SIZE)
@@ -58,21 +72,31 @@ def startup():
     globals.goals = [goal_left, goal_right]
     
     # set up one sprite group for the bars, we add it to the globals
-    globals.bars = pygame.sprite.RenderUpdates()
+    globals.bars = pygame.sprite.Group()
+    # and another for the sprites of their penguins, over the bars covers
+    # (see actors.BarCover)
+    globals.penguins = pygame.sprite.LayeredUpdates()
     
     globals.controllers = []
     
-    # create as many IRController as told on the config file
-    for i in xrange(globals.config['num_wiimotes']):
-        globals.controllers.append(control.IRController(btaddr=globals.config['wm'][i],
-                                                        controller_secuence=[0,0,0,0])) #TODO specify sequence
-    # fill every other controller with keycontrollers
-    for i in xrange(4 - globals.config['num_wiimotes']):
-        globals.controllers.append(control.KeyController())
-    
     numbars = 8
     bar_x_teams = [0, 0, 1, 0 ,1 ,0 ,1 ,1]
     
+    if globals.headless or ai_players:
+        # nobody is playing, every bar plays on its own
+        for i in xrange(numbars):
+            globals.controllers.append(headless_controller())
+        controller_order = range(numbars)
+    else:
+        # create as many IRController as told on the config file
+        for i in xrange(globals.config['num_wiimotes']):
+            globals.controllers.append(control.IRController(btaddr=globals.config['wm'][i],
+                                                            controller_secuence=[0,0,0,0])) #TODO specify sequence
+        # fill every other controller with keycontrollers
+        for i in xrange(4 - globals.config['num_wiimotes']):
+            globals.controllers.append(control.KeyController())
+        controller_order = globals.config['controller_order']
+    
     # align penguin bars according to the distances between them. we determine that according to the number of the bars, which are constant.
     bars_separation = globals.FIELD_SIZE[0] / numbars
     bars_start = globals.FIELD_TOP_LEFT[0]
@@ -81,35 +105,47 @@ def startup():
     for i in xrange(numbars):
         actor = actors.PenguinBar(bars_start + bars_separation * i,
                                   globals.config['penguins_x_bars'][i],
-                                  globals.controllers[globals.config['controller_order'][i]],
+                                  globals.controllers[controller_order[i]],
                                   bar_x_teams[i])
         globals.bars.add(actor)
         
-        bimx = (actor.rect.x +
-                (actor.sprite_size -
-                 actors.PenguinBar.bar_image.get_rect().w) / 2.0)
-        field_bg.blit(actors.PenguinBar.bar_image,
-                      (bimx, actor.rect.y))
+        if globals.headless:
+            continue
+        field_bg.blit(actors.PenguinBar.bar_image, actor.bar_image_pos)
     
     # scores: the index of a team should be the same index of his goal
     globals.score = [0, 0]
     # An effects layer, to control public, scoreboards, etc...
     globals.assets = pygame.sprite.RenderUpdates()
-    globals.assets.add(actors.ScoreBoard())
-    if globals.config['game']['time']:
-        globals.assets.add(actors.Timer((400, 100)))
+    # and another for the ones that seldom change, drawn only when they do
+    globals.hud = ChangedUpdates()
+    if not globals.headless:
+        globals.hud.add(actors.ScoreBoard())
+        if globals.config['game']['time']:
+            globals.hud.add(actors.Timer((400, 100)))
+    # the balls of the last startup go away with their group
+    actors.Ball.reset_pool()
     # another for the balls (could be more than one?), balls are also in globals
     globals.balls = pygame.sprite.RenderUpdates()
+    globals.profiler = profiler.Profiler()
+    globals.gc_scheduler = garbage.Scheduler()
+    globals.snapshot = world.Snapshot(globals.bars,
+                                      globals.config['game']['max_balls'])
     actors.Ball.extra_ball()
     
     # add dynamic public actors
-    globals.assets.add(actors.Public('resources/images/tuzbolo.png',
-                                    (480, 45), 1, 1000, 4))
+    if not globals.headless:
+        # and scale the goal celebration now, not on the first goal
+        actors.GoalAnimation.load_images()
+        globals.assets.add(actors.Public('resources/images/tuzbolo.png',
+                                        (480, 45), 1, 1000, 4))
     
     # kickoff! not needed but nice
     for ball in globals.balls:
         ball.kickoff()
+    globals.snapshot.read(globals.balls)
 
+@timeline.traced('input')
 def process_events():
     """Processess mouse and kb events for the main ui"""
     global _running
@@ -124,6 +160,14 @@ def process_events():
                     ball.kickoff()
             if event.key == K_a: # extra ball
                 actors.Ball.extra_ball()
+            if event.key == K_h: # frame profiler HUD
+                prof = globals.profiler
+                prof.show = not prof.show
+                if not prof.show:
+                    r = pygame.Rect((0, globals.DISPLAY_SIZE[1] - profiler.HUD_SIZE[1]),
+                                    profiler.HUD_SIZE)
+                    display.blit(field_bg, r, r)
+                    pygame.display.update(r)
             if event.key == K_o: # raise fps limit (debug)
                 globals.FPS += 1
                 print globals.FPS
@@ -132,19 +176,101 @@ def process_events():
                 print globals.FPS
 
 
+class Match:
+    '''The simulation of a match on the table built by startup.
+    Matches are played one after the other on the same world, reset puts
+    everything back in place without rebuilding anything, so the last match
+    of the day costs the same as the first one.
+    @stepper is the world.Stepper running the simulation
+    @sim_step is the function that runs a single step of it'''
+    def __init__(self):
+        self.stepper = world.Stepper()
+        self.contacts = ode.JointGroup()
+        
+        # local functions and variables are faster to call in a loop, so we
+        # cache them before looping
+        balls = globals.balls
+        kinematic = [bar for bar in globals.bars if bar.kinematic]
+        w_step = globals.ode_world.step
+        collide = world.collide
+        cgroup = self.contacts
+        stats = world.stats
+        clock = time.time
+        snapshot = globals.snapshot
+        read = snapshot.read
+        apply_forces = actors.Ball.apply_forces
+        
+        # the most a ball can move on a step without going through anything
+        conf = globals.config['physics']
+        max_travel = conf['ccd_fraction'] * world.pix_to_dist(
+                        min((actors.PenguinBar.PENGUIN_SIZE, actors.Ball.RADIOUS)))
+        max_substeps = conf['ccd_max_substeps']
+        
+        def step(h):
+            for bar in kinematic:
+                bar.drive(h)
+            apply_forces(balls)
+            collide(cgroup)
+            start = clock()
+            w_step(h)
+            end = clock()
+            stats['world_time'] += end - start
+            stats['world_steps'] += 1
+            if globals.timeline:
+                globals.timeline.span('step', start, end, 'physics')
+            read(balls)
+        
+        def sim_step(dt):
+            '''A single fixed step of the simulation. It's split in substeps
+            when the fastest ball would go further than max_travel in it'''
+            vel = snapshot.ball_vel[snapshot.ball_active]
+            v2 = (vel[:, 0] ** 2 + vel[:, 1] ** 2).max() if len(vel) else 0
+            n = min((int(math.sqrt(v2) * dt / max_travel) + 1, max_substeps))
+            if n > 1:
+                stats['substeps'] += n
+                if n > stats['peak_substeps']:
+                    stats['peak_substeps'] = n
+                h = dt / n
+                for i in xrange(n):
+                    step(h)
+            else:
+                step(dt)
+        self.sim_step = sim_step
+    
+    def reset(self):
+        '''Leaves the table as it was after startup: scores cleared, bars on
+        their rest position and a single ball kicked off from the middle'''
+        globals.score = [0, 0]
+        globals.goal_log = []
+        globals.time_limit = 0
+        for stat in world.stats:
+            world.stats[stat] = 0
+        
+        # the pending extra balls of the last match
+        for asset in globals.assets.sprites():
+            if isinstance(asset, actors.GoalAnimation):
+                asset.kill()
+        for ball in globals.balls.sprites():
+            ball.retire()
+        for bar in globals.bars:
+            bar.reset()
+        for con in globals.controllers:
+            con.reset()
+        self.contacts.empty()
+        self.stepper.reset()
+        
+        actors.Ball.extra_ball()
+        globals.snapshot.read(globals.balls)
+
 def main_loop():
     '''Main game plays in here. First determine user actions, then run game in the given state such as playing, paused, credits, victory etc..  '''
     c = pygame.time.Clock()
-    # local functions and variables are faster to call in a loop, so we cache
-    # them before looping
-    fps = globals.FPS
     bars = globals.bars
     balls = globals.balls
     assets = globals.assets
-    w_step = globals.ode_world.step
-    s_collide = globals.ode_space.collide
-    cgroup = ode.JointGroup()
-    collission_callback = world.ccback
+    match = Match()
+    stepper, sim_step = match.stepper, match.sim_step
+    gc_scheduler = globals.gc_scheduler
     first_loop = 1
     max_goals = globals.config['game']['goals']
     globals.time_limit = 0
@@ -153,9 +279,11 @@ def main_loop():
     while _running:
         process_events()
         if state == globals.ST_PLAYING:
-            state = playing(c, fps, bars, balls, assets, cgroup,
-                            s_collide, w_step, collission_callback, max_goals)
+            gc_scheduler.play()
+            state = playing(c, bars, balls, assets, stepper, sim_step,
+                            max_goals)
         elif state == globals.ST_END: # game end
+            gc_scheduler.pause()
             if not new_match_time:
                 new_match_time = pygame.time.get_ticks() + globals.config['game']['wait_time']
                     
@@ -178,11 +306,12 @@ def main_loop():
             if pygame.time.get_ticks() > new_match_time:
                 new_match_time = 0
                 state = globals.ST_PLAYING
-                globals.score = [0, 0]
-                globals.time_limit = 0
+                match.reset()
                 display.blit(field_bg, (0, 0))
                 pygame.display.update()
+                globals.hud.repaint()
         elif state == globals.ST_WAITING: # not all controllers are ready to play
+            gc_scheduler.pause()
             display.blit(field_bg, (0, 0))
             globals.font.render(display, "Esperando jugadores", (200, 250), 1)
             globals.font.render(display, "Presione 1 y 2", (100, 350), 1)
@@ -203,6 +332,7 @@ def main_loop():
             if ready:
                 display.blit(field_bg, (0, 0))
                 pygame.display.update()
+                globals.hud.repaint()
                 state = globals.ST_PLAYING
     
     # close every wiimote connection before exiting
@@ -211,28 +341,66 @@ def main_loop():
             c.wm.close()
 
 
-def playing (c, fps, bars, balls, assets, cgroup, s_collide, w_step, collission_callback, max_goals):
+def advance(bars, balls, assets, stepper, sim_step, elapsed, max_goals):
+    '''Updates the actors and runs the simulation for the @elapsed seconds,
+    that is, the part of the playing state that doesn't draw anything
+    @returns the next game state'''
+    prof = globals.profiler
+    stats = world.stats
+    globals.snapshot.to_pixels()
+    globals.snapshot.index_lanes()
+    bars.update(0)
+    actors.Ball.update_all(balls)
+    assets.update(0)
+    globals.hud.update(0)
+    prof.lap('update')
+    
+    pairs, contacts = stats['pairs'], stats['contacts']
+    collide, w_step = stats['collide_time'], stats['world_time']
+    start = time.time()
+    steps = stepper.advance(elapsed, sim_step)
+    stats['step_time'] += time.time() - start
+    prof.simulation(steps, stats['pairs'] - pairs, stats['contacts'] - contacts,
+                    stats['collide_time'] - collide, stats['world_time'] - w_step)
+    
+    # ====== End game conditions
+    if globals.time_limit:
+        if world.ticks() > globals.time_limit:
+            return globals.ST_END
+    else:
+        globals.time_limit = globals.config['game']['time'] + world.ticks()
+    if max(globals.score) >= max_goals:
+        return globals.ST_END        
+    # ======
+    return globals.ST_PLAYING
+
+def playing (c, bars, balls, assets, stepper, sim_step, max_goals):
     '''Game state actions for playing state,
     arguments are the local variables from the main loop variables from'''
+    prof = globals.profiler
+    prof.start()
     # clear
-    bars.clear(display, field_bg)
+    globals.penguins.clear(display, field_bg)
     balls.clear(display, field_bg)
     assets.clear(display, field_bg)
     #display.blit(field_bg, (0, -2.0))
+    prof.lap('clear')
     
-    # updating
-    bars.update(0)
-    balls.update(0)
-    assets.update(0)
-    cgroup.empty()
-    s_collide(cgroup, collission_callback)
-    w_step(1.0/(c.get_fps() or fps))
+    # updating, the simulation catches up with the time the last frame took,
+    # in steps of a fixed size whatever the frame rate
+    state = advance(bars, balls, assets, stepper, sim_step,
+                    c.get_time() / 1000.0, max_goals)
+    # the hud sprites that changed or that will be drawn over, once the rest
+    # know where they are going to be drawn
+    hud = globals.hud
+    hud.clear(display, field_bg, touched((balls, globals.penguins, assets)))
     
     # and drawing
     dirty = []
     dirty += balls.draw(display)
-    dirty += bars.draw(display)
+    dirty += globals.penguins.draw(display)
     dirty += assets.draw(display)
+    dirty += hud.draw(display)
     
     # === DEBUG
     # fps
@@ -259,6 +427,31 @@ def playing (c, fps, bars, balls, assets, cgroup, s_collide, w_step, collission_
             
         globals.debug_font.render(display, str(a), (0, 15))
         
+        # collision pairs sent to ccback since the last frame, the ones
+        # kept out by the collision categories and the contacts of the last
+        # step (and the most on a step)
+        stats = world.stats
+        globals.debug_font.render(display, "pairs: %d culled: %d" %
+                                  (stats['pairs'], world.culled_pairs()),
+                                  (0, 30))
+        globals.debug_font.render(display, "contacts: %d peak: %d" %
+                                  (stats['step_contacts'],
+                                   stats['peak_contacts']),
+                                  (0, 45))
+        # substeps run for fast balls since the last frame, and the most on
+        # a single step
+        globals.debug_font.render(display, "substeps: %d peak: %d" %
+                                  (stats['substeps'], stats['peak_substeps']),
+                                  (0, 60))
+        # texts of the game font drawn from its cache (see actors.Font)
+        globals.debug_font.render(display, "text cache: %d/%d" %
+                                  (globals.font.hits,
+                                   globals.font.hits + globals.font.misses),
+                                  (0, 75))
+        stats['pairs'] = 0
+        stats['substeps'] = 0
+        dirty += [pygame.Rect((0, 15, 150, 75))]
+        
 #        for bar in globals.bars:
 #            for body in bar.bodies:
 #                bpos = body.getPosition()
@@ -266,21 +459,119 @@ def playing (c, fps, bars, balls, assets, cgroup, s_collide, w_step, collission_
 #                pygame.draw.circle(display, (255, 0, 0), dpos, 16)
     # ======
     
+    if prof.show:
+        dirty.append(prof.draw(display, globals.debug_font,
+                               (0, globals.DISPLAY_SIZE[1] - profiler.HUD_SIZE[1])))
+    
+    # fewer and bigger regions, display.update is slow on a lot of small ones
+    dirty = coalesce(dirty)
+    prof.count('rects', len(dirty))
+    prof.count('pixels', pixels(dirty))
+    prof.lap('draw')
+    
     pygame.display.update(dirty)
     #pygame.display.update() # clear all the screen
+    prof.lap('flip')
     
-    # ====== End game conditions
-    if globals.time_limit:
-        if pygame.time.get_ticks() > globals.time_limit:
-            return globals.ST_END
-    else:
-        globals.time_limit = globals.config['game']['time'] + pygame.time.get_ticks()
-    if max(globals.score) >= max_goals:
-        return globals.ST_END        
-    # ======
+    # garbage collection on the time left to the frame, before the clock
+    # waits it away
+    globals.gc_scheduler.idle(1.0 / globals.FPS - (time.time() - prof.frame_start))
+    prof.lap('gc')
+    prof.end()
     
+    start = time.time()
     c.tick(globals.FPS)
-    return globals.ST_PLAYING
+    if globals.timeline:
+        globals.timeline.span('tick', start, time.time())
+    return state
+
+def headless_match(match):
+    '''Plays a whole match without drawing anything and without waiting for
+    the clock, so it runs as fast as the simulation can
+    @match is the Match to reset and play
+    @returns a dict with the final score, the simulated duration of the match
+    in seconds, the real time it took and the goals as a list of
+    (milliseconds, goal) in the order they were scored, the times in integer
+    ticks of the game clock (see world.ticks) from the start of the match'''
+    bars = globals.bars
+    balls = globals.balls
+    assets = globals.assets
+    max_goals = globals.config['game']['goals']
+    stepper, sim_step = match.stepper, match.sim_step
+    dt = stepper.dt
+    
+    match.reset()
+    start_ticks = world.ticks()
+    start = time.time()
+    prof = globals.profiler
+    state = globals.ST_PLAYING
+    while state == globals.ST_PLAYING:
+        prof.start()
+        state = advance(bars, balls, assets, stepper, sim_step, dt, max_goals)
+        prof.end()
+    
+    return {'score': tuple(globals.score),
+            'duration': (world.ticks() - start_ticks) / 1000.0,
+            'real_time': time.time() - start,
+            'goals': [(t - start_ticks, goal) for t, goal in globals.goal_log]}
+
+def headless_loop(matches):
+    '''Plays the given number of matches one after the other, headless,
+    printing the result of each one'''
+    match = Match()
+    for i in xrange(matches):
+        r = headless_match(match)
+        print "match %d: %d - %d in %.1fs (%.2fs real)" % (i, r['score'][1],
+                                                           r['score'][0],
+                                                           r['duration'],
+                                                           r['real_time'])
+
+def stress_loop(target):
+    '''Stress test for the multi-ball mode: a ball more gets on the table on
+    every frame up to @target, and every second of frames the ball count is
+    printed with the mean frame, simulation step and collision times. Every
+    bar plays on its own and the match never ends. It runs until ESC, or
+    when headless, until a second after reaching @target'''
+    match = Match()
+    match.reset()
+    bars = globals.bars
+    balls = globals.balls
+    assets = globals.assets
+    stepper, sim_step = match.stepper, match.sim_step
+    stats = world.stats
+    c = pygame.time.Clock()
+    report = int(globals.FPS)
+    frames = 0
+    frame_time = 0.0
+    stats['step_time'] = stats['collide_time'] = 0.0
+    print "balls  frame ms  step ms  collide ms"
+    while _running:
+        if len(balls) < target:
+            actors.Ball.extra_ball()
+        if globals.headless:
+            start = time.time()
+            globals.profiler.start()
+            advance(bars, balls, assets, stepper, sim_step, stepper.dt, 0)
+            globals.profiler.end()
+            frame_time += time.time() - start
+        else:
+            process_events()
+            globals.gc_scheduler.play()
+            # the state is ignored, so the match doesn't end
+            playing(c, bars, balls, assets, stepper, sim_step, 0)
+            frame_time += c.get_rawtime() / 1000.0 # without the fps wait
+        frames += 1
+        
+        if frames == report:
+            print "%5d  %8.2f  %7.2f  %10.2f" % (len(balls),
+                                                  frame_time * 1000 / frames,
+                                                  stats['step_time'] * 1000 / frames,
+                                                  stats['collide_time'] * 1000 / frames)
+            if globals.headless and len(balls) >= target:
+                break
+            frames = 0
+            frame_time = 0.0
+            stats['step_time'] = stats['collide_time'] = 0.0
 
 def debug_points(srf, points, color=(255, 0, 0)):
     '''Draws the view of a wiimote camera, given the last points registered by
@@ -301,7 +592,42 @@ def debug_points(srf, points, color=(255, 0, 0)):
     return srf
 
 if __name__ == '__main__':
-    # TODO parse command line options
+    parser = OptionParser()
+    parser.add_option('--headless', action='store_true', default=False,
+                      help='run only the simulation, without display nor '
+                           'sound, with every bar played by the computer')
+    parser.add_option('--matches', type='int', default=1,
+                      help='number of matches to play when headless')
+    parser.add_option('--trace', default=globals.config['trace'],
+                      help='record the frame timeline to this file, Chrome '
+                           'trace_event json or json lines if it ends in '
+                           '.jsonl')
+    parser.add_option('--balls', type='int', default=0,
+                      help='stress test: put up to this number of balls on '
+                           'the table, played by the computer, and print '
+                           'the frame, step and collide times')
+    options, args = parser.parse_args()
+    if options.balls:
+        globals.config['game']['max_balls'] = max((options.balls,
+                                        globals.config['game']['max_balls']))
+    if options.trace:
+        globals.timeline = timeline.Recorder(options.trace,
+                                    globals.config['trace_max_mb'] << 20,
+                                    globals.config['trace_backups'])
+    
+    if options.headless:
+        globals.headless = 1
+        globals.sound = 0
+        world.init_ode()
+        startup()
+        if options.balls:
+            stress_loop(options.balls)
+        else:
+            headless_loop(options.matches)
+        if globals.timeline:
+            globals.timeline.close()
+        sys.exit(0)
+    
     pygame.init()
     pygame.mouse.set_visible(0)
         
@@ -314,7 +640,8 @@ if __name__ == '__main__':
     field_bg = pygame.image.load('resources/images/fondo.jpg')
     ##play sound in infinite loop
     if globals.sound:
-        pygame.mixer.init()
+        actors.init_sound()
+    if globals.sound:
         if globals.config['ambient_sound']:
             actors.ambience_channel.play(actors.ambience_sound,-1)
     # init game font
@@ -327,14 +654,20 @@ if __name__ == '__main__':
     world.init_ode()
     
     # init the game variables
-    startup()
+    startup(ai_players=options.balls)
     
     # paint the full background once
     display.blit(field_bg, (0, 0))
-    globals.font.render(display, "Esperando a los jugadores", (200, 300), 1)
-    globals.font.render(display, "Presionen 1+2 en todos los mandos", (100, 350), 1)
+    if not options.balls:
+        globals.font.render(display, "Esperando a los jugadores", (200, 300), 1)
+        globals.font.render(display, "Presionen 1+2 en todos los mandos", (100, 350), 1)
     pygame.display.update()
     
     # start the game!
-    main_loop()
+    if options.balls:
+        stress_loop(options.balls)
+    else:
+        main_loop()
+    if globals.timeline:
+        globals.timeline.close()
     
@@ -22,57 +22,395 @@
    Moreover, includes mainly conversion functions between world coordinates and pixel coordinates because pyode and pygame uses
    different coordinating system '''
 
-import ode
+import time
+import numpy
 import globals
 
+# physics engine, the flat one has the pyode interface so the rest of the
+# game imports ode from here
+ENGINE = globals.config['physics']['engine']
+if ENGINE == 'flat':
+    import flat as ode
+else:
+    import ode
+
 _half_screen_w = globals.DISPLAY_SIZE[0] / 2.0
 _half_screen_h = globals.DISPLAY_SIZE[1] / 2.0
+_scale = globals.PIXELS_PER_UNIT
+
+# contact materials as (mu, bounce), a contact gets the sum of the values of
+# both colliding materials
+MATERIALS = {'wall': (0.0, 0.0),
+             'ball': (0.0, 0.5),
+             'penguin': (0.0, -0.5)} # will not bounce the ball, so we can stop it
+
+# (material, material) -> (mu, bounce) for every pair, so the collision
+# callback doesn't need to compute them
+_contact_params = {}
+for m1 in MATERIALS:
+    for m2 in MATERIALS:
+        _contact_params[m1, m2] = (MATERIALS[m1][0] + MATERIALS[m2][0],
+                                   MATERIALS[m1][1] + MATERIALS[m2][1])
+_geom_materials = {} # geom -> material name
+
+# collision categories, as ode category bits. Only the pairs with a ball can
+# matter, so the rest are filtered out by ode before reaching ccback
+CAT_WALL = 1
+CAT_BALL = 2
+CAT_PENGUIN = 4
+CAT_ALL = CAT_WALL | CAT_BALL | CAT_PENGUIN
+# material -> (category bits, collide bits)
+CATEGORIES = {'wall': (CAT_WALL, CAT_BALL),
+              'ball': (CAT_BALL, CAT_ALL),
+              'penguin': (CAT_PENGUIN, CAT_BALL)}
 
-def init_ode():
-    '''Inits ode global variables needed to start the simulation'''
+# collision counters: pairs reaching ccback and contact joints created since
+# the last reset, contacts on the last step, the most on a single step and the
+# ones left out by the limits. Also the substeps for fast balls, in total and
+# the most on a single step (see tuzbolin.Match), and the seconds spent
+# running the simulation, the collisions and world.step (see tuzbolin.advance,
+# collide and tuzbolin.Match)
+stats = {'pairs': 0,
+         'contacts': 0,
+         'step_contacts': 0,
+         'peak_contacts': 0,
+         'dropped': 0,
+         'substeps': 0,
+         'peak_substeps': 0,
+         'step_time': 0.0,
+         'collide_time': 0.0,
+         'world_time': 0.0,
+         'collides': 0, # collide calls, a step split in substeps makes more
+         'world_steps': 0} # world.step calls, the same
+
+_max_contacts = globals.config['physics']['max_contacts']
+_max_step_contacts = globals.config['physics']['max_step_contacts']
+
+def new_space(kind=None):
+    '''Creates the main collision space
+    @kind is simple, hash or quadtree, defaults to the one on the config file
+    @returns the ode space'''
+    conf = globals.config['physics']
+    kind = kind or conf['space']
+    if kind == 'simple': # tests every pair, only good for a few geoms
+        return ode.SimpleSpace()
+    elif kind == 'hash':
+        space = ode.HashSpace()
+        space.setLevels(*conf['hash_levels'])
+        return space
+    elif kind == 'quadtree':
+        # the extents are half the size of the root block, the field
+        extents = (pix_to_dist(globals.FIELD_SIZE[0] / 2.0),
+                   pix_to_dist(globals.FIELD_SIZE[1] / 2.0),
+                   1.0)
+        return ode.QuadTreeSpace((0, 0, 0), extents, conf['quadtree_depth'])
+    raise ValueError("unknown collision space: %s" % kind)
+
+def init_ode(space=None):
+    '''Inits ode global variables needed to start the simulation
+    @space the kind of collision space to use, see new_space'''
     globals.ode_world = ode.World() # world is the object that does the dynamic symulation
     #globals.ode_world.setGravity((0,0,-9.81))
     
-    globals.ode_space = ode.HashSpace() # space is does the collision test and response
+    globals.ode_space = new_space(space) # space is does the collision test and response
+    # the walls don't move nor collide between them, they go in their own
+    # space inside the main one, which only balls get tested against
+    globals.ode_static_space = ode.SimpleSpace(globals.ode_space)
+    globals.ode_static_space.setCategoryBits(CAT_WALL)
+    globals.ode_static_space.setCollideBits(CAT_BALL)
+    _geom_materials.clear()
+
+def set_material(geom, material):
+    '''Sets the contact material and the collision category of a geom, every
+    geom on the space must have one before the first collision test
+    @material is one of the keys of MATERIALS'''
+    _geom_materials[geom] = material
+    category, collide = CATEGORIES[material]
+    geom.setCategoryBits(category)
+    geom.setCollideBits(collide)
+
+def forget_geom(geom):
+    '''Takes a geom out of its space and of the material table, it won't
+    collide anymore'''
+    geom.disable()
+    geom.getSpace().remove(geom)
+    _geom_materials.pop(geom, None)
+
+def _count_pairs(space):
+    '''Counts the pairs of geoms that space.collide would test'''
+    count = [0]
+    def callback(args, geom1, geom2):
+        if geom1.isSpace() or geom2.isSpace():
+            ode.collide2(geom1, geom2, None, callback)
+        else:
+            count[0] += 1
+    space.collide(None, callback)
+    return count[0]
+
+def culled_pairs():
+    '''Counts the candidate pairs that the collision categories are keeping
+    away from ccback, for the current positions. It runs the broadphase
+    twice, so it's meant for debugging and benchmarks only'''
+    filtered = _count_pairs(globals.ode_space)
+    geoms = _geom_materials.keys() + [globals.ode_static_space]
+    bits = [g.getCollideBits() for g in geoms]
+    for g in geoms:
+        g.setCollideBits(CAT_ALL)
+    try:
+        everything = _count_pairs(globals.ode_space)
+    finally:
+        for g, b in zip(geoms, bits):
+            g.setCollideBits(b)
+    return everything - filtered
+    
+class Stepper:
+    '''Advances the simulation in fixed steps, decoupled from the drawing rate.
+    The time elapsed between frames is accumulated and consumed in steps of
+    @dt seconds. At most @max_substeps steps are run per frame, any time left
+    after that is dropped so a slow frame slows the game down instead of
+    making every following frame slower'''
+    def __init__(self, rate=globals.PHYSICS_RATE,
+                 max_substeps=globals.MAX_SUBSTEPS):
+        self.dt = 1.0 / rate
+        self.max_substeps = max_substeps
+        self.accumulator = 0.0
+
+    def advance(self, elapsed, step):
+        '''Runs as many steps as fit in the accumulated time
+        @elapsed is the time since the last call, in seconds
+        @step is a callable that simulates a single step of the given seconds
+        @returns the number of steps run'''
+        self.accumulator += elapsed
+        dt = self.dt
+        n = 0
+        while self.accumulator >= dt:
+            if n >= self.max_substeps: # can't keep up, forget about it
+                self.accumulator = 0.0
+                break
+            step(dt)
+            globals.sim_time += dt
+            self.accumulator -= dt
+            n += 1
+        return n
+
+    def reset(self):
+        '''Forgets any accumulated time'''
+        self.accumulator = 0.0
+
+class Snapshot:
+    '''The state of the table, read from the physics engine in a single pass
+    after each step (see read). The game reads positions and velocities from
+    its arrays instead of asking the engine body by body.
+    @ball_pos and @ball_vel are (max_balls, 3) arrays, a row per Ball.slot
+    @ball_active tells the slots of the balls on the game
+    @bar_angle has the angle of every bar, see angle
+    @penguin_pos has the position of every penguin, see penguins
+    @ball_pix and @penguin_pix are the pixel positions for the frame, see
+    to_pixels
+    @ball_lane has the index on @bars of the lane every ball is in, -1 for
+    the ones not on the game, see index_lanes'''
+    def __init__(self, bars, max_balls):
+        '''@bars are the penguin bars, they don't change until the next
+        startup
+        @max_balls is the most balls there can be on the game'''
+        self.bars = list(bars)
+        self.bar_index = {}
+        self.slices = {}
+        n = 0
+        for i, bar in enumerate(self.bars):
+            self.bar_index[bar] = i
+            self.slices[bar] = slice(n, n + bar.num_penguins)
+            n += bar.num_penguins
+        self.ball_pos = numpy.zeros((max_balls, 3))
+        self.ball_vel = numpy.zeros((max_balls, 3))
+        self.ball_active = numpy.zeros(max_balls, bool)
+        self.bar_angle = numpy.zeros(len(self.bars))
+        self.penguin_pos = numpy.zeros((n, 3))
+        self.ball_pix = numpy.zeros((max_balls, 2))
+        self.penguin_pix = numpy.zeros((n, 2))
+        
+        # the bars don't move along x, so the field is split in a column
+        # around each one, its lane, at the middle points between them
+        bar_x = numpy.array([bar.bar_pos[0] for bar in self.bars])
+        self.lane_bar = numpy.argsort(bar_x) # lane (left to right) -> bar
+        sorted_x = bar_x[self.lane_bar]
+        self.lane_edges = (sorted_x[1:] + sorted_x[:-1]) / 2.0
+        self.ball_lane = numpy.empty(max_balls, int)
+        self.ball_lane.fill(-1)
+        self.lane_slots = numpy.zeros(0, int)
+        self.lane_start = numpy.zeros(len(self.bars) + 1, int)
+    
+    def read(self, balls):
+        '''Copies the state of @balls, the ones on the game, and the bars from
+        the engine'''
+        balls = list(balls)
+        self.ball_active[:] = False
+        if balls:
+            slots = [b.slot for b in balls]
+            self.ball_pos[slots] = [b.body.getPosition() for b in balls]
+            self.ball_vel[slots] = [b.body.getLinearVel() for b in balls]
+            self.ball_active[slots] = True
+        self.bar_angle[:] = [bar.angle() for bar in self.bars]
+        self.penguin_pos[:] = [p for bar in self.bars
+                                 for p in bar.penguin_positions()]
     
+    def to_pixels(self):
+        '''Converts the positions to pixels, once a frame for every sprite'''
+        self.ball_pix = w_to_pix_array(self.ball_pos)
+        self.penguin_pix = w_to_pix_array(self.penguin_pos)
+    
+    def index_lanes(self):
+        '''Buckets the balls on the game by the lane they are in, once a
+        frame. Then each bar asks for the balls in its lane alone (see lane)
+        instead of going through all of them'''
+        active = numpy.flatnonzero(self.ball_active)
+        lane = self.lane_bar[numpy.searchsorted(self.lane_edges,
+                                                self.ball_pos[active, 0])]
+        self.ball_lane.fill(-1)
+        self.ball_lane[active] = lane
+        order = numpy.argsort(lane, kind='mergesort')
+        self.lane_slots = active[order]
+        self.lane_start = numpy.searchsorted(lane[order],
+                                             numpy.arange(len(self.bars) + 1))
+    
+    def lane(self, bar):
+        '''@returns the slots of the balls in the lane of the @bar, as of the
+        last index_lanes'''
+        i = self.bar_index[bar]
+        return self.lane_slots[self.lane_start[i]:self.lane_start[i + 1]]
+    
+    def nearest_bar(self, ball):
+        '''@returns the bar whose lane the @ball is in, the nearest one along
+        the x axis, None if the ball is not on the game'''
+        i = self.ball_lane[ball.slot]
+        if i < 0:
+            return None
+        return self.bars[i]
+    
+    def read_ball(self, ball):
+        '''Copies the state of a single @ball, for the ones moved by the game
+        between steps (see Ball.kickoff)'''
+        self.ball_pos[ball.slot] = ball.body.getPosition()
+        self.ball_vel[ball.slot] = ball.body.getLinearVel()
+        self.ball_active[ball.slot] = True
+    
+    def forget_ball(self, ball):
+        '''The @ball left the game, see Ball.retire'''
+        self.ball_active[ball.slot] = False
+    
+    def angle(self, bar):
+        '''@returns the angle of the @bar'''
+        return self.bar_angle[self.bar_index[bar]]
+    
+    def penguins(self, bar):
+        '''@returns a (penguins, 3) view of the positions of the @bar penguins'''
+        return self.penguin_pos[self.slices[bar]]
+    
+    def penguins_pix(self, bar):
+        '''@returns a (penguins, 2) view of the pixel positions of the @bar
+        penguins, see to_pixels'''
+        return self.penguin_pix[self.slices[bar]]
+
+def ticks():
+    '''Milliseconds simulated since the start. This is the game clock, unlike
+    pygame.time.get_ticks it runs as fast as the simulation does'''
+    # rounded, the sum of the steps carries float noise (12 steps of 1/60
+    # can be 199.99999 ms)
+    return int(round(globals.sim_time * 1000))
+
 def w_to_pix(p):
     '''Convert world coordinates to pixel coordinates.
     @p (x, y, z) is the world coordinates of a point
     @returns (x, y) in pixel coordinates'''
-    return _half_screen_w+170*p[0], _half_screen_h-170*p[1]
+    return _half_screen_w+_scale*p[0], _half_screen_h-_scale*p[1]
 
 def pix_to_w(p):
     '''Convert pixel coordinates to ode world coordinates.
     @p (x,y) is the pixel coordinates of a point in the screen
     @returns (x, y, 0) in world coordinates'''
-    return (p[0]-_half_screen_w)/170.0, (_half_screen_h - p[1])/170.0, 0
+    return (p[0]-_half_screen_w)/_scale, (_half_screen_h - p[1])/_scale, 0
+
+def w_to_pix_array(p):
+    '''Convert many world coordinates to pixel coordinates at once.
+    @p is a (n, 2) or (n, 3) array of world coordinates
+    @returns a (n, 2) array of pixel coordinates'''
+    p = numpy.asarray(p, float)
+    pix = numpy.empty((len(p), 2))
+    numpy.multiply(p[:, 0], _scale, pix[:, 0])
+    pix[:, 0] += _half_screen_w
+    numpy.multiply(p[:, 1], -_scale, pix[:, 1])
+    pix[:, 1] += _half_screen_h
+    return pix
+
+def pix_to_w_array(p):
+    '''Convert many pixel coordinates to world coordinates at once.
+    @p is a (n, 2) array of pixel coordinates
+    @returns a (n, 3) array of world coordinates, with z 0'''
+    p = numpy.asarray(p, float)
+    w = numpy.zeros((len(p), 3))
+    w[:, 0] = (p[:, 0] - _half_screen_w) / _scale
+    w[:, 1] = (_half_screen_h - p[:, 1]) / _scale
+    return w
 
 def dist_to_pix(d):
     '''Convert ode world distance to pixel distance.
-    @d is the distance in ode units
+    @d is the distance in ode units, or a numpy array of them
     @returns the distance in pixels'''
-    return d * 170
+    return d * _scale
 
 def pix_to_dist(d):
     '''Convert pixel distance to ode world units distance.
-    @d is the distance in pixels
+    @d is the distance in pixels, or a numpy array of them
     @returns the distance in ode units'''
-    return d/170.0
+    return d / _scale
+
+def collide(contactgroup):
+    '''Replaces the contact joints of the last step in @contactgroup with the
+    ones for the current positions. The group keeps the memory of the joints
+    between steps, so emptying it and filling it again is cheap'''
+    start = time.time()
+    contactgroup.empty()
+    stats['step_contacts'] = 0
+    globals.ode_space.collide(contactgroup, ccback)
+    end = time.time()
+    stats['collide_time'] += end - start
+    stats['collides'] += 1
+    if globals.timeline:
+        globals.timeline.span('collide', start, end, 'physics')
+    n = stats['step_contacts']
+    stats['contacts'] += n
+    if n > stats['peak_contacts']:
+        stats['peak_contacts'] = n
 
 def ccback(contactgroup, geom1, geom2):
     '''Collision callback. This function is called by space.collide to test if
-    any objects in the space can be colliding'''
-    mu = 0.0 # friction
-    bounce = 0.0
-    # test for our custom defined attributes
-    if hasattr(geom1, 'mu'): mu += geom1.mu
-    if hasattr(geom2, 'mu'): mu += geom2.mu
-    if hasattr(geom1, 'bounce'): bounce += geom1.bounce
-    if hasattr(geom2, 'bounce'): bounce += geom2.bounce
-
+    any objects in the space can be colliding.
+    No more than max_contacts contacts are created for a pair, nor more than
+    max_step_contacts on a step (see collide), so ball pile-ups can't make
+    the step time explode'''
+    if geom1.isSpace() or geom2.isSpace(): # a geom against the static space
+        ode.collide2(geom1, geom2, contactgroup, ccback)
+        return
+    stats['pairs'] += 1
     contacts = ode.collide(geom1, geom2) # this is the real collision test
+    if not contacts:
+        return
+    n = len(contacts)
+    room = max((0, min((_max_contacts,
+                        _max_step_contacts - stats['step_contacts']))))
+    if n > room:
+        stats['dropped'] += n - room
+        contacts = contacts[:room]
+        n = room
+    stats['step_contacts'] += n
+    
+    mu, bounce = _contact_params[_geom_materials[geom1],
+                                 _geom_materials[geom2]]
+    w = globals.ode_world
+    body1 = geom1.getBody()
+    body2 = geom2.getBody()
     for c in contacts:
         c.setBounce(bounce)
         c.setMu(mu)
-        j = ode.ContactJoint(globals.ode_world, contactgroup, c)
-        j.attach(geom1.getBody(), geom2.getBody())
\ No newline at end of file
+        j = ode.ContactJoint(w, contactgroup, c)
+        j.attach(body1, body2)
\ No newline at end of file